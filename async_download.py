@@ -0,0 +1,527 @@
+# async_download.py
+# Download concorrente con asyncio + aiohttp: un pool di connessioni condiviso,
+# un numero limitato di richieste in volo e un token bucket PER HOST tarato sui
+# limiti documentati dei servizi (niente sleep fissi dopo ogni articolo).
+# Le risposte vengono scritte a blocchi su un file temporaneo e rinominate solo
+# a download completo; con ETag/Last-Modified salvati le pagine invariate
+# costano un 304.
+# Errori: retry con backoff esponenziale (con jitter) che rispetta Retry-After;
+# per ogni host un circuit breaker sospende le richieste quando gli errori
+# aumentano e il rate si adatta (dimezza sugli errori, risale con i successi).
+import asyncio
+import datetime
+import email.utils
+import inspect
+import os
+import random
+import time
+from collections import deque
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import aiohttp
+
+# Richieste al secondo (rate) e burst massimo (capacity) per host.
+# - E-utilities NCBI: 3 richieste/s senza API key, 10/s con API key
+# - arXiv: una richiesta ogni 3 secondi
+EUTILS_HOST = "eutils.ncbi.nlm.nih.gov"
+EUTILS_RATE = 3.0
+EUTILS_RATE_WITH_KEY = 10.0
+HOST_RATES = {
+    EUTILS_HOST: (EUTILS_RATE, 1),
+    "arxiv.org": (1 / 3, 1),
+    "export.arxiv.org": (1 / 3, 1),
+}
+DEFAULT_RATE = (5.0, 1)         # host non elencati
+
+MAX_CONCURRENCY = 16            # richieste in volo al massimo (tutti gli host)
+MAX_PER_HOST = 8                # connessioni aperte al massimo verso lo stesso host
+QUEUE_SIZE = 256                # job in attesa: la lista dei job può essere un generatore lungo
+REQUEST_TIMEOUT = 30            # secondi per richiesta
+RETRY = 3
+CHUNK_SIZE = 64 * 1024          # byte scritti su disco per volta
+
+# Retry: attesa ~BACKOFF_BASE × 2^(tentativo-1) con jitter, al massimo BACKOFF_MAX;
+# se il server manda Retry-After si attende quello (fino a MAX_RETRY_AFTER)
+RETRY_STATUSES = {403, 429, 500, 502, 503, 504}   # i 403 di PMC arrivano quando si va troppo veloci
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+MAX_RETRY_AFTER = 300.0
+
+# Circuit breaker per host: aperto quando, sulle ultime BREAKER_WINDOW risposte
+# (almeno BREAKER_MIN_REQUESTS), gli errori superano BREAKER_ERROR_RATE. Dopo
+# BREAKER_COOLDOWN secondi passa una richiesta di prova: se va bene si riparte,
+# altrimenti la pausa raddoppia (fino a BREAKER_MAX_COOLDOWN).
+BREAKER_WINDOW = 20
+BREAKER_MIN_REQUESTS = 10
+BREAKER_ERROR_RATE = 0.5
+BREAKER_COOLDOWN = 30.0
+BREAKER_MAX_COOLDOWN = 600.0
+
+# Rate adattivo (AIMD): ogni errore dimezza il rate dell'host (al massimo una
+# volta al secondo, mai sotto MIN_RATE_FRACTION del rate configurato), ogni
+# successo lo riavvicina al rate configurato
+MIN_RATE_FRACTION = 0.1
+RATE_INCREASE_FRACTION = 0.05
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/116.0 Safari/537.36"
+}
+
+
+def eutils_rates(api_key=None):
+    """HOST_RATES con il limite E-utilities giusto (più alto se c'è un'API key)."""
+    rates = dict(HOST_RATES)
+    rates[EUTILS_HOST] = (EUTILS_RATE_WITH_KEY if api_key else EUTILS_RATE, 1)
+    return rates
+
+
+# ============================================================
+# VALIDATORI HTTP (ETag / Last-Modified)
+# ============================================================
+
+# 'validators' è un oggetto con get(url) / validators[url] = {...}: un dict
+# o crawl_state.ValidatorStore, che li conserva tra un'esecuzione e l'altra
+
+def conditional_headers(validators, url):
+    """Header If-None-Match / If-Modified-Since per una URL già scaricata."""
+    saved = (validators or {}).get(url)
+    if not saved:
+        return {}
+    headers = {}
+    if saved.get("etag"):
+        headers["If-None-Match"] = saved["etag"]
+    if saved.get("last_modified"):
+        headers["If-Modified-Since"] = saved["last_modified"]
+    return headers
+
+
+def remember_validators(validators, url, response_headers):
+    if validators is None:
+        return
+    etag = response_headers.get("ETag")
+    last_modified = response_headers.get("Last-Modified")
+    if etag or last_modified:
+        validators[url] = {"etag": etag, "last_modified": last_modified}
+
+
+def write_atomic(out_file: Path, chunks):
+    """Scrive i blocchi su out_file.part e lo rinomina solo alla fine."""
+    tmp = out_file.with_name(out_file.name + ".part")
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp, out_file)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+# ============================================================
+# RETRY
+# ============================================================
+
+def parse_retry_after(value):
+    """Secondi indicati da un header Retry-After (numero o data HTTP), o None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Attesa prima del tentativo successivo ad 'attempt' (1 = primo tentativo fallito)."""
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_AFTER)
+    ceiling = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+    # metà fissa + metà casuale: i worker falliti insieme non riprovano insieme
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+# ============================================================
+# RATE LIMIT E CIRCUIT BREAKER PER HOST
+# ============================================================
+
+class TokenBucket:
+    """
+    Token bucket: 'rate' token al secondo, al massimo 'capacity' accumulati.
+    Ogni richiesta consuma un token; se non ce ne sono si attende quanto basta.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.max_rate = rate
+        self.capacity = capacity
+        self._last_decrease = 0.0
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Il lock mette in fila le richieste: vengono servite nell'ordine di arrivo
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def slow_down(self):
+        now = time.monotonic()
+        if now - self._last_decrease >= 1.0:
+            self.rate = max(self.rate / 2, self.max_rate * MIN_RATE_FRACTION)
+            self._last_decrease = now
+
+    def speed_up(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_INCREASE_FRACTION)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker di un host: "chiuso" (richieste libere), "aperto" (nessuna
+    richiesta fino a open_until), "semiaperto" (passa una sola richiesta di prova).
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self.outcomes = deque(maxlen=BREAKER_WINDOW)
+        self.state = "chiuso"
+        self.cooldown = BREAKER_COOLDOWN
+        self.open_until = 0.0
+        self.paused_until = 0.0         # Retry-After: pausa senza aprire il breaker
+        self.probe_started = None
+        self.openings = 0
+        self.recoveries = 0             # prove in semiaperto andate a buon fine
+
+    async def wait(self):
+        """Attende che l'host accetti richieste."""
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            if self.state == "chiuso":
+                return
+            if self.state == "aperto":
+                if now < self.open_until:
+                    await asyncio.sleep(self.open_until - now)
+                    continue
+                self.state = "semiaperto"
+            # semiaperto: una richiesta di prova alla volta (una prova senza esito
+            # dopo REQUEST_TIMEOUT viene considerata persa)
+            if self.probe_started is None or now - self.probe_started > 2 * REQUEST_TIMEOUT:
+                self.probe_started = now
+                return
+            await asyncio.sleep(0.1)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + min(seconds, MAX_RETRY_AFTER))
+
+    def success(self):
+        if self.state == "semiaperto":
+            print(f"   ✅ {self.host}: di nuovo raggiungibile, riprendo")
+            self.state = "chiuso"
+            self.recoveries += 1
+            self.cooldown = BREAKER_COOLDOWN
+            self.outcomes.clear()
+            self.probe_started = None
+        elif self.state == "chiuso":
+            self.outcomes.append(True)
+
+    def failure(self):
+        """Registra un errore; ritorna True se il breaker si è appena aperto."""
+        if self.state == "semiaperto":
+            self.probe_started = None
+            self._open(self.cooldown * 2)
+            return True
+        if self.state == "chiuso":
+            self.outcomes.append(False)
+            errors = self.outcomes.count(False)
+            if (len(self.outcomes) >= BREAKER_MIN_REQUESTS
+                    and errors / len(self.outcomes) >= BREAKER_ERROR_RATE):
+                self._open(self.cooldown)
+                return True
+        return False
+
+    def _open(self, cooldown):
+        self.cooldown = min(cooldown, BREAKER_MAX_COOLDOWN)
+        self.state = "aperto"
+        self.open_until = time.monotonic() + self.cooldown
+        self.openings += 1
+        print(f"   ⛔ {self.host}: troppi errori, richieste sospese per {self.cooldown:.1f}s")
+
+
+class HostLimiter:
+    """Per ogni host un TokenBucket e un CircuitBreaker, creati al primo utilizzo."""
+
+    def __init__(self, rates=None, default=DEFAULT_RATE):
+        self.rates = HOST_RATES if rates is None else rates
+        self.default = default
+        self.buckets = {}
+        self.breakers = {}
+
+    def bucket(self, url):
+        host = urlsplit(url).hostname or ""
+        if host not in self.buckets:
+            rate, capacity = self.rates.get(host, self.default)
+            self.buckets[host] = TokenBucket(rate, capacity)
+        return self.buckets[host]
+
+    def breaker(self, url):
+        host = urlsplit(url).hostname or ""
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(host)
+        return self.breakers[host]
+
+    async def acquire(self, url):
+        await self.breaker(url).wait()
+        await self.bucket(url).acquire()
+
+    def success(self, url):
+        self.breaker(url).success()
+        self.bucket(url).speed_up()
+
+    def failure(self, url, retry_after=None):
+        if retry_after is not None:
+            self.breaker(url).pause(retry_after)
+        self.breaker(url).failure()
+        self.bucket(url).slow_down()
+
+    def openings(self):
+        return sum(b.openings for b in self.breakers.values())
+
+
+# ============================================================
+# DOWNLOAD
+# ============================================================
+
+async def _stream_to_file(response, out_file: Path):
+    """Come write_atomic, leggendo il body a blocchi. Ritorna i byte scritti."""
+    tmp = out_file.with_name(out_file.name + ".part")
+    size = 0
+    try:
+        with open(tmp, "wb") as f:
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp, out_file)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return size
+
+
+async def fetch_to_file(session, limiter, url, out_file: Path, retries=None, data=None,
+                        validators=None, info=None, metrics=None):
+    """
+    Scarica 'url' in out_file rispettando il limite dell'host (POST se c'è 'data',
+    es. efetch con molti ID). Con 'validators' e out_file già su disco la GET è
+    condizionale: se la pagina non è cambiata il server risponde 304 e il file
+    resta quello già salvato.
+    Ritorna lo status HTTP finale (200, 304, 404, ...) o None se tutti i
+    tentativi falliscono. Se c'è, 'info' viene riempito con tentativi, byte
+    scritti e latenza (secondi) dell'ultimo tentativo; 'metrics'
+    (crawl_metrics.CrawlMetrics) registra ogni singola richiesta.
+    """
+    retries = RETRY if retries is None else retries
+    info = {} if info is None else info
+    info.update(tentativi=0, bytes=None, latenza=None)
+    host = urlsplit(url).hostname or ""
+
+    def observe(status, size=None):
+        info["latenza"] = time.perf_counter() - start
+        if metrics is not None:
+            if status is None:
+                metrics.request_failed(host, info["latenza"])
+            else:
+                metrics.request_done(host, status, info["latenza"], size)
+
+    for attempt in range(1, retries + 1):
+        await limiter.acquire(url)
+        info["tentativi"] = attempt
+        start = time.perf_counter()
+        retry_after = None
+        status = None
+        try:
+            if data is None:
+                # senza il file un 304 non avrebbe niente da confermare
+                headers = conditional_headers(validators, url) if out_file.exists() else None
+                request = session.get(url, headers=headers)
+            else:
+                request = session.post(url, data=data)
+            async with request as r:
+                status = r.status
+                if r.status in (304, 404):
+                    observe(r.status)
+                    limiter.success(url)
+                    return r.status
+                if r.status in RETRY_STATUSES:
+                    retry_after = parse_retry_after(r.headers.get("Retry-After"))
+                    raise aiohttp.ClientResponseError(r.request_info, r.history, status=r.status,
+                                                      message=r.reason or "")
+                if r.status >= 400:
+                    # errore definitivo (400, 410, ...): inutile riprovare, l'host però sta bene
+                    observe(r.status)
+                    limiter.success(url)
+                    print(f"   ⚠ HTTP {r.status} on {url}: not retried")
+                    return None
+                info["bytes"] = await _stream_to_file(r, out_file)
+                if data is None:
+                    remember_validators(validators, url, r.headers)
+            observe(r.status, info["bytes"])
+            limiter.success(url)
+            return r.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # 403/429/5xx; un errore a metà del body (es. ClientPayloadError dopo
+            # un 200) conta come errore di rete, come quelli senza risposta
+            observe(status if status in RETRY_STATUSES else None)
+            limiter.failure(url, retry_after)
+            print(f"   ⚠ Error downloading {url} (attempt {attempt}): {type(e).__name__}: {e}")
+            if attempt < retries:
+                if metrics is not None:
+                    metrics.retry(host)
+                await asyncio.sleep(backoff_delay(attempt, retry_after))
+    return None
+
+
+async def fetch_json(session, limiter, url, params=None, retries=None):
+    """
+    GET di una risposta JSON (es. esearch) con il limite dell'host e la stessa
+    politica di retry di fetch_to_file. Un errore definitivo (es. 400) o
+    l'ultimo tentativo fallito rilanciano l'eccezione.
+    """
+    retries = RETRY if retries is None else retries
+    for attempt in range(1, retries + 1):
+        await limiter.acquire(url)
+        retry_after = None
+        definitive = False
+        try:
+            async with session.get(url, params=params) as r:
+                if r.status in RETRY_STATUSES:
+                    retry_after = parse_retry_after(r.headers.get("Retry-After"))
+                else:
+                    definitive = r.status >= 400
+                r.raise_for_status()
+                result = await r.json(content_type=None)
+            limiter.success(url)
+            return result
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if definitive:
+                limiter.success(url)    # l'host risponde, è la richiesta a essere sbagliata
+                raise
+            limiter.failure(url, retry_after)
+            if attempt == retries:
+                raise
+            print(f"   ⚠ Error on {url} (attempt {attempt}): {type(e).__name__}: {e}")
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
+
+
+async def download_all(jobs, on_done=None, rates=None, concurrency=MAX_CONCURRENCY,
+                       per_host=MAX_PER_HOST, headers=None, validators=None, metrics=None,
+                       limiter=None):
+    """
+    Scarica i job (key, url, out_file) o (key, url, out_file, data) per le
+    richieste POST, con al massimo 'concurrency' richieste in volo e il rate
+    limit per host. on_done(key, status, info) viene chiamata nel loop per ogni
+    job concluso (es. per aggiornare crawl_state); info è quello di fetch_to_file.
+    Se on_done restituisce un awaitable viene atteso prima di prendere il job
+    successivo: così uno stadio a valle lento rallenta anche i download.
+    'validators' rende condizionali le GET e viene aggiornato con gli
+    ETag/Last-Modified ricevuti. Con 'metrics' (crawl_metrics.CrawlMetrics)
+    durante la run sono attivi l'endpoint di stato e il riepilogo periodico.
+    'limiter' (HostLimiter) permette di condividere i limiti per host con chi
+    produce i job (es. le esearch di PMC); di default ne viene creato uno con 'rates'.
+    Ritorna {"ok": n, "non_modificati": n, "404": n, "falliti": n,
+    "breaker_aperture": n, "secondi": s}.
+    """
+    stats = {"ok": 0, "non_modificati": 0, "404": 0, "falliti": 0}
+    limiter = HostLimiter(rates) if limiter is None else limiter
+    queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    start = time.perf_counter()
+
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    if metrics is not None:
+        await metrics.start(queue=queue, limiter=limiter)
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=headers or HEADERS) as session:
+
+            async def worker():
+                while True:
+                    job = await queue.get()
+                    if job is None:
+                        return
+                    key, url, out_file, data = job if len(job) == 4 else (*job, None)
+                    info = {}
+                    if metrics is not None:
+                        metrics.in_flight += 1
+                    try:
+                        status = await fetch_to_file(session, limiter, url, Path(out_file), data=data,
+                                                     validators=validators, info=info, metrics=metrics)
+                    except Exception as e:  # un job non deve fermare gli altri
+                        print(f"   ⚠ Unexpected error on {url}: {type(e).__name__}: {e}")
+                        status = None
+                    finally:
+                        if metrics is not None:
+                            metrics.in_flight -= 1
+                    if status == 304:
+                        outcome = "non_modificati"
+                    elif status == 404:
+                        outcome = "404"
+                    elif status is None:
+                        outcome = "falliti"
+                    else:
+                        outcome = "ok"
+                    stats[outcome] += 1
+                    if metrics is not None:
+                        metrics.job_done(outcome)
+                    if on_done is not None:
+                        result = on_done(key, status, info)
+                        if inspect.isawaitable(result):
+                            await result
+
+            workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+            try:
+                # La coda limitata fa da backpressure: i job vengono letti solo quando c'è posto.
+                # 'jobs' può essere anche un generatore asincrono (es. un harvest che attende la rete)
+                if hasattr(jobs, "__aiter__"):
+                    async for job in jobs:
+                        await queue.put(job)
+                else:
+                    for job in jobs:
+                        await queue.put(job)
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                # se il generatore dei job fallisce i worker non devono restare appesi
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+    finally:
+        if metrics is not None:
+            await metrics.stop()
+
+    stats["breaker_aperture"] = limiter.openings()
+    stats["secondi"] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def run_downloads(jobs, **kwargs):
+    """Versione sincrona di download_all, per gli script."""
+    return asyncio.run(download_all(jobs, **kwargs))
@@ -0,0 +1,594 @@
+# benchmark.py
+# Benchmark e controlli OFFLINE della pipeline di ingestione:
+# non serve Elasticsearch, lavora direttamente sui file HTML del corpus.
+import asyncio
+import datetime
+import glob
+import json
+import os
+import random
+import re
+import time
+import tempfile
+import tracemalloc
+
+import async_download
+import crawl_metrics
+import synthetic_corpus
+from html_document import ParsedDocument, as_soup, available_parsers, load_document, read_html
+from index_documents import parse_html
+from instrumentation import percentile
+from extract_tables import (build_paragraph_postings, extract_paragraphs, extract_tables_from_html,
+                            find_context_candidates, find_table_mentions, tokenize)
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+CORPUS_DIRS = ["html_corpus/arxiv_html", "html_corpus/pmc_html"]
+MAX_FILES = 200           # file usati per benchmark e confronti (None = tutti)
+
+# Campi che devono coincidere tra i backend di parsing
+EQUIVALENCE_FIELDS = ["title", "authors", "date", "abstract", "paragraphs"]
+
+# Numero di tabelle per pagina nel benchmark del context matching
+TABLE_COUNTS = (1, 5, 10, 30, 60)
+SYNTHETIC_PARAGRAPHS = 300
+
+# File più grandi del corpus usati nel benchmark di memoria dell'albero ridotto
+LARGEST_FILES = 10
+
+# Equivalenza tra backend e albero ridotto anche senza html_corpus: pagine
+# sintetiche per layout, più una pagina grande per layout
+SYNTHETIC_CHECK_PAGES = 5
+SYNTHETIC_CHECK_LARGE = {"paragraphs": 800, "tables": 60}
+
+VOCAB = synthetic_corpus.VOCAB
+
+# Suite su corpus sintetico: ogni dimensione varia da sola, le altre restano ai valori base
+SUITE_BASE = {"paragraphs": 50, "tables": 5, "authors": 5}
+SUITE_SCALING = {
+    "paragraphs": (10, 50, 200, 800),
+    "tables": (0, 5, 20, 60),
+    "authors": (1, 5, 20, 100),
+}
+SUITE_PAGES = 10                # pagine generate per ogni punto della suite
+SUITE_MEMORY_PAGES = 3          # pagine misurate con tracemalloc (rallenta molto)
+REPORT_DIR = "reports"
+BASELINE_REPORT = None          # report JSON di una run precedente da confrontare (None = no)
+REGRESSION_TOLERANCE = 0.20     # p50 più lento di oltre il 20% = regressione
+
+# Downloader asincrono contro un server HTTP locale (nessuna richiesta esterna)
+STUB_JOBS = 60                  # articoli "scaricati" dal server stub
+STUB_LATENCY = 0.3              # secondi di latenza simulata per risposta
+STUB_RATE = 10.0                # richieste/s consentite verso lo stub (come E-utilities con API key)
+STUB_404_EVERY = 10             # un articolo ogni N non esiste (404)
+OUTAGE_SECONDS = 2.0            # durata del disservizio simulato (503 + Retry-After)
+# Finestra del breaker ridotta per il benchmark: con 20/10 richieste non si
+# aprirebbe mai in un disservizio di pochi secondi (ci penserebbe solo Retry-After)
+OUTAGE_BREAKER_WINDOW = 6
+OUTAGE_BREAKER_MIN_REQUESTS = 4
+
+
+def corpus_files(limit=MAX_FILES):
+    """File HTML del corpus in ordine stabile (i primi 'limit')."""
+    files = []
+    for d in CORPUS_DIRS:
+        files.extend(sorted(glob.glob(os.path.join(d, "*.html"))))
+    return files[:limit] if limit else files
+
+
+def synthetic_check_files(out_dir, pages=SYNTHETIC_CHECK_PAGES):
+    """Scrive in out_dir le pagine sintetiche dei controlli di equivalenza; ritorna i percorsi."""
+    files = []
+    for layout in synthetic_corpus.LAYOUTS:
+        folder = os.path.join(out_dir, layout)
+        files += synthetic_corpus.generate_corpus(folder, layout, pages)
+        files += synthetic_corpus.generate_corpus(folder, layout, 1, seed=pages, **SYNTHETIC_CHECK_LARGE)
+    return files
+
+
+def extract_all(filepath, parser):
+    """parse_html + extract_tables con un singolo parsing, come in process_file."""
+    document = load_document(filepath, parser=parser)
+    doc = parse_html(filepath, document=document)
+    tables = extract_tables_from_html(document, paper_id=os.path.basename(filepath))
+    return doc, tables
+
+
+# ============================================================
+# 1. EQUIVALENZA TRA BACKEND
+# ============================================================
+
+def compare_backends(files, backends=None, reference="html.parser"):
+    """
+    Confronta l'output di ogni backend con quello di riferimento.
+    Ritorna la lista delle differenze (file, backend, campo).
+    """
+    backends = backends or available_parsers()
+    mismatches = []
+    for filepath in files:
+        ref_doc, ref_tables = extract_all(filepath, reference)
+        for backend in backends:
+            if backend == reference:
+                continue
+            doc, tables = extract_all(filepath, backend)
+            for field in EQUIVALENCE_FIELDS:
+                if (ref_doc or {}).get(field) != (doc or {}).get(field):
+                    mismatches.append((filepath, backend, field))
+            if ref_tables != tables:
+                mismatches.append((filepath, backend, "tables"))
+
+    print(f"\n=== EQUIVALENZA BACKEND (riferimento: {reference}) ===")
+    print(f"File confrontati: {len(files)}, backend: {', '.join(backends)}")
+    if not mismatches:
+        print("[OK] Output identico su tutti i campi.")
+    for filepath, backend, field in mismatches:
+        print(f"[DIFF] {backend} / {field}: {filepath}")
+    return mismatches
+
+
+# ============================================================
+# 2. THROUGHPUT PER BACKEND
+# ============================================================
+
+def bench_backends(files, backends=None):
+    """Documenti al secondo (parse_html + extract_tables) per ogni backend."""
+    backends = backends or available_parsers()
+    results = {}
+    print("\n=== THROUGHPUT BACKEND ===")
+    for backend in backends:
+        start = time.perf_counter()
+        for filepath in files:
+            extract_all(filepath, backend)
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        results[backend] = len(files) / elapsed
+        print(f"{backend:<12} {results[backend]:8.1f} doc/s  ({len(files)} file in {elapsed:.2f}s)")
+    return results
+
+
+# ============================================================
+# 3. CONTEXT MATCHING DELLE TABELLE (indice invertito)
+# ============================================================
+
+def synthetic_page(n_tables, n_paragraphs=SYNTHETIC_PARAGRAPHS, seed=0):
+    """Pagina HTML sintetica con n_tables tabelle e n_paragraphs paragrafi."""
+    rnd = random.Random(seed)
+
+    def sentence(n_words):
+        return " ".join(rnd.choice(VOCAB) for _ in range(n_words)).capitalize() + "."
+
+    parts = ["<html><body>"]
+    for i in range(n_paragraphs):
+        text = sentence(40)
+        if n_tables and i % 7 == 0:
+            text += f" Results are reported in Table {rnd.randint(1, n_tables)}."
+        parts.append(f"<p>{text}</p>")
+    for t in range(1, n_tables + 1):
+        rows = "".join(
+            "<tr>" + "".join(f"<td>{rnd.choice(VOCAB)} {rnd.random():.2f}</td>" for _ in range(4)) + "</tr>"
+            for _ in range(6)
+        )
+        parts.append(f'<table id="tab{t}"><caption>Table {t}: {sentence(8)}</caption>{rows}</table>')
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def _context_paragraphs_naive(key_terms, paragraphs, mentions):
+    """Algoritmo precedente: ri-tokenizza ogni paragrafo per ogni tabella."""
+    context = []
+    for par in paragraphs:
+        if par in mentions:
+            continue
+        if len(key_terms & set(tokenize(par))) >= 2:
+            context.append(par)
+    return context
+
+
+def bench_context_matching(table_counts=TABLE_COUNTS):
+    """
+    Confronta, al crescere del numero di tabelle, il context matching con
+    l'indice invertito e l'algoritmo precedente (che deve dare lo stesso output).
+    """
+    print(f"\n=== CONTEXT MATCHING ({SYNTHETIC_PARAGRAPHS} paragrafi) ===")
+    print(f"{'tabelle':>8}{'naive ms':>12}{'indice ms':>12}{'speedup':>10}  output")
+    results = {}
+    for n_tables in table_counts:
+        soup = as_soup(synthetic_page(n_tables))
+        tables = extract_tables_from_html(soup, paper_id="synthetic")
+        paragraphs = extract_paragraphs(soup)
+        key_terms = [set(tokenize(t["caption"]) + tokenize(t["body"])) for t in tables]
+
+        start = time.perf_counter()
+        naive = [_context_paragraphs_naive(k, paragraphs, t["mentions"]) for k, t in zip(key_terms, tables)]
+        naive_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        postings = build_paragraph_postings(paragraphs)
+        for k in key_terms:
+            find_context_candidates(k, postings)
+        indexed_s = time.perf_counter() - start
+
+        same = naive == [t["context_paragraphs"] for t in tables]
+        results[n_tables] = (naive_s, indexed_s, same)
+        print(f"{n_tables:>8}{naive_s * 1000:>12.1f}{indexed_s * 1000:>12.1f}"
+              f"{naive_s / max(indexed_s, 1e-9):>9.1f}x  {'identico' if same else 'DIVERSO'}")
+    return results
+
+
+def _mentions_naive(paragraphs, table_num):
+    """Algoritmo precedente: due regex compilate e una scansione completa per tabella."""
+    patterns = [
+        re.compile(rf"\b[Tt]able\s*{table_num}\b"),
+        re.compile(rf"\b[Tt]ab\.?\s*{table_num}\b"),
+    ]
+    return [par for par in paragraphs if any(p.search(par) for p in patterns)]
+
+
+def bench_mention_detection(table_counts=TABLE_COUNTS):
+    """
+    Rilevamento delle citazioni "Table N": una scansione per tabella (precedente)
+    contro un'unica scansione dei paragrafi per tutte le tabelle.
+    """
+    print(f"\n=== CITAZIONI DELLE TABELLE ({SYNTHETIC_PARAGRAPHS} paragrafi) ===")
+    print(f"{'tabelle':>8}{'naive ms':>12}{'1 pass ms':>12}{'speedup':>10}  output")
+    results = {}
+    for n_tables in table_counts:
+        paragraphs = extract_paragraphs(as_soup(synthetic_page(n_tables)))
+        numbers = range(1, n_tables + 1)
+
+        start = time.perf_counter()
+        naive = [_mentions_naive(paragraphs, n) for n in numbers]
+        naive_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = find_table_mentions(paragraphs)
+        single = [[paragraphs[pid] for pid in index.get(n, ())] for n in numbers]
+        single_s = time.perf_counter() - start
+
+        same = naive == single
+        results[n_tables] = (naive_s, single_s, same)
+        print(f"{n_tables:>8}{naive_s * 1000:>12.1f}{single_s * 1000:>12.1f}"
+              f"{naive_s / max(single_s, 1e-9):>9.1f}x  {'identico' if same else 'DIVERSO'}")
+    return results
+
+
+# ============================================================
+# 4. ALBERO RIDOTTO PER L'ESTRAZIONE DELLE TABELLE (memoria)
+# ============================================================
+
+def largest_files(n=LARGEST_FILES):
+    """Gli n file HTML più grandi del corpus."""
+    files = corpus_files(limit=None)
+    return sorted(files, key=os.path.getsize, reverse=True)[:n]
+
+
+def _peak_memory(func, *args, **kwargs):
+    """Esegue func e ritorna (risultato, picco di memoria allocata in byte)."""
+    tracemalloc.start()
+    try:
+        result = func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def bench_restricted_tree(files, parser="html.parser"):
+    """
+    Estrazione delle tabelle con l'albero completo e con quello ridotto
+    (TableStrainer): tempo, picco di memoria (tracemalloc) e uguaglianza dell'output.
+    """
+    print(f"\n=== ALBERO RIDOTTO ({len(files)} file, {parser}) ===")
+    print(f"{'KB':>8}{'completo ms':>13}{'ridotto ms':>12}{'completo MB':>13}{'ridotto MB':>12}  output  file")
+    results = []
+    for filepath in files:
+        html = read_html(filepath)
+        if html is None:
+            continue
+        row = {"file": filepath, "kb": len(html) / 1024}
+        outputs = {}
+        for mode, restricted in (("completo", False), ("ridotto", True)):
+            start = time.perf_counter()
+            outputs[mode] = extract_tables_from_html(html, "bench", parser=parser, restricted=restricted)
+            row[mode + "_s"] = time.perf_counter() - start
+            _, row[mode + "_peak"] = _peak_memory(
+                extract_tables_from_html, html, "bench", parser=parser, restricted=restricted)
+        row["identico"] = outputs["completo"] == outputs["ridotto"]
+        results.append(row)
+        print(f"{row['kb']:>8.0f}{row['completo_s'] * 1000:>13.1f}{row['ridotto_s'] * 1000:>12.1f}"
+              f"{row['completo_peak'] / 2**20:>13.1f}{row['ridotto_peak'] / 2**20:>12.1f}  "
+              f"{'ok' if row['identico'] else 'DIVERSO':<7} {os.path.basename(filepath)}")
+    return results
+
+
+# ============================================================
+# 5. SUITE SU CORPUS SINTETICO (parse_html + extract_tables)
+# ============================================================
+
+def _run_pipeline(html, name, parser):
+    """Costruzione dell'albero, parse_html ed extract_tables su una pagina; tempi in secondi."""
+    start = time.perf_counter()
+    document = ParsedDocument(html, name, parser=parser)
+    t_soup = time.perf_counter()
+    parse_html(name, document=document)
+    t_parse = time.perf_counter()
+    extract_tables_from_html(document, paper_id=name)
+    t_tables = time.perf_counter()
+    return {"soup": t_soup - start, "parse_html": t_parse - t_soup,
+            "extract_tables": t_tables - t_parse, "totale": t_tables - start}
+
+
+def bench_point(layout, sizes, pages=SUITE_PAGES, memory_pages=SUITE_MEMORY_PAGES, parser="html.parser"):
+    """
+    Misura un punto della suite: 'pages' pagine generate con le dimensioni
+    'sizes'. Ritorna doc/s, percentili di latenza per funzione e picco di memoria.
+    """
+    htmls = [synthetic_corpus.generate_page(layout, seed, **sizes) for seed in range(pages)]
+    samples = {"soup": [], "parse_html": [], "extract_tables": [], "totale": []}
+    for seed, html in enumerate(htmls):
+        for name, seconds in _run_pipeline(html, synthetic_corpus.page_name(layout, seed), parser).items():
+            samples[name].append(seconds)
+
+    peak = 0
+    for seed, html in enumerate(htmls[:memory_pages]):
+        _, page_peak = _peak_memory(_run_pipeline, html, synthetic_corpus.page_name(layout, seed), parser)
+        peak = max(peak, page_peak)
+
+    latency = {}
+    for name, values in samples.items():
+        values.sort()
+        latency[name] = {q: round(percentile(values, q) * 1000, 3) for q in (50, 95, 99)}
+    total = sum(samples["totale"])
+    return {
+        "layout": layout,
+        "sizes": dict(sizes),
+        "kb_medi": round(sum(len(h) for h in htmls) / len(htmls) / 1024, 1),
+        "doc_s": round(len(htmls) / max(total, 1e-9), 2),
+        "latenza_ms": latency,
+        "picco_mb": round(peak / 2**20, 2),
+    }
+
+
+def run_suite(layouts=synthetic_corpus.LAYOUTS, scaling=None, base=None, parser="html.parser"):
+    """Esegue la suite: per ogni layout fa variare una dimensione alla volta."""
+    scaling = scaling or SUITE_SCALING
+    base = base or SUITE_BASE
+    print(f"\n=== SUITE SINTETICA ({SUITE_PAGES} pagine per punto, {parser}) ===")
+    print(f"{'layout':<7}{'dimensione':<12}{'valore':>7}{'KB':>8}{'doc/s':>9}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'tabelle p50':>13}{'picco MB':>10}")
+    points = []
+    for layout in layouts:
+        for dimension, values in scaling.items():
+            for value in values:
+                point = bench_point(layout, dict(base, **{dimension: value}), parser=parser)
+                point["dimensione"] = dimension
+                points.append(point)
+                lat = point["latenza_ms"]
+                print(f"{layout:<7}{dimension:<12}{value:>7}{point['kb_medi']:>8.0f}{point['doc_s']:>9.1f}"
+                      f"{lat['totale'][50]:>9.1f}{lat['totale'][95]:>9.1f}{lat['totale'][99]:>9.1f}"
+                      f"{lat['extract_tables'][50]:>13.1f}{point['picco_mb']:>10.1f}")
+    return points
+
+
+def _point_key(point):
+    return (point["layout"], point["dimensione"], json.dumps(point["sizes"], sort_keys=True))
+
+
+def compare_with_baseline(points, baseline_path, tolerance=REGRESSION_TOLERANCE):
+    """
+    Confronta la latenza p50 di ogni punto con quella di un report precedente.
+    Ritorna la lista delle regressioni (punto, funzione, p50 prima, p50 ora).
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {_point_key(p): p for p in json.load(f)["points"]}
+    regressions = []
+    for point in points:
+        old = baseline.get(_point_key(point))
+        if not old:
+            continue
+        for name, lat in point["latenza_ms"].items():
+            before, now = old["latenza_ms"][name]["50"], lat[50]
+            if before and now > before * (1 + tolerance):
+                regressions.append((_point_key(point), name, before, now))
+
+    print(f"\n=== CONFRONTO CON {baseline_path} (tolleranza {tolerance:.0%}) ===")
+    if not regressions:
+        print("[OK] Nessuna regressione.")
+    for (layout, dimension, sizes), name, before, now in regressions:
+        print(f"[REGRESSIONE] {layout} {sizes} {name}: p50 {before:.1f} -> {now:.1f} ms")
+    return regressions
+
+
+def write_suite_report(points, parser="html.parser"):
+    """Salva i risultati della suite in REPORT_DIR (riusabile come BASELINE_REPORT)."""
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(REPORT_DIR, f"bench_sintetico_{stamp}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"parser": parser, "pages": SUITE_PAGES, "points": points}, f, ensure_ascii=False, indent=2)
+    print(f"Report della suite: {path}")
+    return path
+
+
+# ============================================================
+# 6) DOWNLOADER ASINCRONO SU SERVER STUB
+# ============================================================
+
+async def _stub_server(latency, hits, outage=0.0):
+    """
+    Server aiohttp su 127.0.0.1 (porta libera) che serve pagine sintetiche con
+    latenza. Nei primi 'outage' secondi risponde 503 con Retry-After.
+    """
+    from aiohttp import web
+    started = time.monotonic()
+
+    async def article(request):
+        hits.append(time.monotonic())
+        await asyncio.sleep(latency)
+        if time.monotonic() - started < outage:
+            raise web.HTTPServiceUnavailable(headers={"Retry-After": "1"})
+        num = int(request.match_info["num"])
+        if num % STUB_404_EVERY == 0:
+            raise web.HTTPNotFound()
+        etag = f'"v1-{num}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        html = synthetic_corpus.generate_page("pmc", num, paragraphs=10, tables=1, boilerplate=10)
+        return web.Response(text=html, content_type="text/html", headers={"ETag": etag})
+
+    app = web.Application()
+    app.router.add_get("/article/{num}", article)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def _bench_async_downloader(out_dir, jobs, latency, rate):
+    hits = []
+    runner, base_url = await _stub_server(latency, hits)
+    validators = {}
+    try:
+        job_list = [(i, f"{base_url}/article/{i}", os.path.join(out_dir, f"PMC{i}.html"))
+                    for i in range(1, jobs + 1)]
+        stats = await async_download.download_all(job_list, rates={"127.0.0.1": (rate, 1)},
+                                                  validators=validators)
+        first_hits = list(hits)
+        # secondo crawl con gli ETag salvati: le pagine invariate devono dare 304
+        recrawl = await async_download.download_all(job_list, rates={"127.0.0.1": (rate, 1)},
+                                                    validators=validators)
+    finally:
+        await runner.cleanup()
+    return stats, recrawl, first_hits
+
+
+def bench_async_downloader(jobs=STUB_JOBS, latency=STUB_LATENCY, rate=STUB_RATE):
+    """
+    Scarica 'jobs' articoli da un server stub locale con il downloader asincrono
+    e verifica che: arrivino tutti i file attesi (senza .part rimasti), i 404
+    vengano contati come tali, il ritmo delle richieste non superi il rate limit
+    per host e un secondo crawl con gli ETag salvati riceva solo 304. Il tempo è
+    confrontato con il vecchio schema sequenziale (latenza + sleep fisso per articolo).
+    """
+    print("\n=== Downloader asincrono (server stub locale) ===")
+    with tempfile.TemporaryDirectory() as out_dir:
+        stats, recrawl, hits = asyncio.run(_bench_async_downloader(out_dir, jobs, latency, rate))
+        downloaded = len(glob.glob(os.path.join(out_dir, "*.html")))
+        leftovers = len(glob.glob(os.path.join(out_dir, "*.part")))
+
+    expected_404 = jobs // STUB_404_EVERY
+    # Finestra di un secondo più affollata: con capacity=1 non può superare rate (+1 di tolleranza)
+    hits.sort()
+    busiest = max((sum(1 for t in hits[i:] if t - start < 1.0) for i, start in enumerate(hits)), default=0)
+    sequential = jobs * (latency + 5.0)   # il vecchio sleep fisso di 5s dopo ogni articolo PMC
+
+    print(f"Job: {jobs} | latenza stub: {latency}s | rate: {rate}/s")
+    print(f"Scaricati: {stats['ok']} (file: {downloaded}) | 404: {stats['404']} | falliti: {stats['falliti']}")
+    print(f"Richieste nel secondo più affollato: {busiest} (limite {rate:.0f})")
+    print(f"Tempo: {stats['secondi']:.1f}s (minimo dal rate: {(jobs - 1) / rate:.1f}s) "
+          f"vs sequenziale con sleep ~{sequential:.0f}s")
+    print(f"Secondo crawl (GET condizionali): {recrawl['non_modificati']} non modificati (304), "
+          f"{recrawl['ok']} riscaricati in {recrawl['secondi']:.1f}s")
+
+    ok = (downloaded == jobs - expected_404 and stats["404"] == expected_404
+          and stats["falliti"] == 0 and busiest <= rate + 1 and leftovers == 0
+          and recrawl["non_modificati"] == jobs - expected_404 and recrawl["ok"] == 0)
+    print("✅ Downloader corretto" if ok else "⚠️ Risultati inattesi dal downloader")
+    return stats
+
+
+async def _bench_outage(out_dir, jobs, rate, outage, metrics):
+    hits = []
+    runner, base_url = await _stub_server(0.05, hits, outage=outage)
+    try:
+        job_list = [(i, f"{base_url}/article/{i}", os.path.join(out_dir, f"PMC{i}.html"))
+                    for i in range(1, jobs + 1)]
+        stats = await async_download.download_all(job_list, rates={"127.0.0.1": (rate, 1)},
+                                                  metrics=metrics)
+    finally:
+        await runner.cleanup()
+    return stats, hits
+
+
+def bench_outage_recovery(jobs=STUB_JOBS, rate=STUB_RATE, outage=OUTAGE_SECONDS):
+    """
+    Server stub che per 'outage' secondi risponde 503: Retry-After e circuit
+    breaker devono limitare le richieste durante il disservizio e tutti i job
+    devono arrivare dopo il ripristino. Il breaker deve aprirsi almeno una
+    volta e una richiesta di prova (semiaperto) deve richiuderlo. Le metriche
+    del crawl devono contare ogni richiesta arrivata allo stub.
+    """
+    print("\n=== Retry e circuit breaker (disservizio simulato) ===")
+    # pause brevi, qualche tentativo in più e finestra del breaker piccola,
+    # in scala con la durata del disservizio
+    overrides = [
+        (async_download, "RETRY", 6),
+        (async_download, "BREAKER_COOLDOWN", outage / 4),
+        (async_download, "BREAKER_WINDOW", OUTAGE_BREAKER_WINDOW),
+        (async_download, "BREAKER_MIN_REQUESTS", OUTAGE_BREAKER_MIN_REQUESTS),
+        (crawl_metrics, "STATUS_PORT", None),
+    ]
+    saved = [(module, name, getattr(module, name)) for module, name, _ in overrides]
+    for module, name, value in overrides:
+        setattr(module, name, value)
+    metrics = crawl_metrics.CrawlMetrics("benchmark")
+    try:
+        with tempfile.TemporaryDirectory() as out_dir:
+            stats, hits = asyncio.run(_bench_outage(out_dir, jobs, rate, outage, metrics))
+    finally:
+        for module, name, value in saved:
+            setattr(module, name, value)
+
+    during = sum(1 for t in hits if t - hits[0] < outage)
+    expected = jobs - jobs // STUB_404_EVERY
+    print(f"Richieste durante il disservizio ({outage:.0f}s): {during} "
+          f"(senza pause fino a {outage * rate:.0f}) | aperture del breaker: {stats['breaker_aperture']}")
+    print(f"Scaricati: {stats['ok']}/{expected} | falliti: {stats['falliti']} | tempo: {stats['secondi']:.1f}s")
+    breakers = metrics.limiter.breakers.values()
+    recoveries = sum(b.recoveries for b in breakers)
+    print(f"Riprese dopo la richiesta di prova: {recoveries} | stato finale del breaker: "
+          f"{', '.join(b.state for b in breakers)}")
+    print(metrics.summary_line())
+    counted = sum(metrics.requests.values())
+    ok = (stats["ok"] == expected and stats["falliti"] == 0 and counted == len(hits)
+          and stats["breaker_aperture"] >= 1 and recoveries >= 1
+          and all(b.state == "chiuso" for b in breakers))
+    print("✅ Ripresa dopo il disservizio" if ok else "⚠️ Job persi durante il disservizio")
+    return stats
+
+
+# ============================================================
+# MAIN
+# ============================================================
+
+def main():
+    bench_context_matching()
+    bench_mention_detection()
+    bench_async_downloader()
+    bench_outage_recovery()
+
+    points = run_suite()
+    write_suite_report(points)
+    if BASELINE_REPORT:
+        compare_with_baseline(points, BASELINE_REPORT)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        synthetic = synthetic_check_files(out_dir)
+        compare_backends(synthetic)
+        bench_restricted_tree(synthetic)
+
+    files = corpus_files()
+    if not files:
+        print("Nessun file HTML trovato in:", ", ".join(CORPUS_DIRS))
+        return
+
+    compare_backends(files)
+    bench_backends(files)
+    bench_restricted_tree(largest_files())
+
+
+if __name__ == "__main__":
+    main()
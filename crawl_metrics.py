@@ -0,0 +1,269 @@
+# crawl_metrics.py
+# Metriche del crawl (downloader asincrono): richieste, byte, status HTTP,
+# latenza delle richieste, retry, profondità della coda dei job, rate e stato
+# del circuit breaker per host.
+#
+# - endpoint di stato in tempo reale (aiohttp, stesso event loop del crawl):
+#   /status in JSON, /metrics nel formato testo di Prometheus
+# - una riga di riepilogo ogni SUMMARY_INTERVAL secondi
+# - report JSON finale, per tarare concorrenza e rate limit sui dati
+import asyncio
+import datetime
+import json
+import os
+import time
+from collections import Counter, defaultdict
+
+from instrumentation import percentile
+
+STATUS_HOST = "127.0.0.1"
+STATUS_PORT = 8765              # None = niente endpoint
+SUMMARY_INTERVAL = 30.0         # secondi tra due righe di riepilogo (None = no)
+REPORT_DIR = "reports"
+
+# Bucket (secondi) dell'istogramma della latenza, come in Prometheus
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Istogramma a bucket cumulativi + campioni per i percentili del report."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)     # l'ultimo è +Inf
+        self.samples = []
+        self.total = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.samples.append(value)
+        self.total += value
+
+    def __len__(self):
+        return len(self.samples)
+
+    def cumulative(self):
+        """[(limite, conteggio cumulativo)] con "+Inf" per l'ultimo bucket."""
+        result, running = [], 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+    def summary(self):
+        values = sorted(self.samples)
+        if not values:
+            return {"count": 0}
+        return {
+            "count": len(values),
+            "mean_ms": round(self.total / len(values) * 1000, 1),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+            "max_ms": round(values[-1] * 1000, 1),
+        }
+
+
+class CrawlMetrics:
+    """
+    Metriche di una run del downloader. async_download le aggiorna a ogni
+    richiesta (download_all(..., metrics=...)); start()/stop() avviano e
+    fermano endpoint e riepilogo periodico nell'event loop del crawl.
+    """
+
+    def __init__(self, name="crawl", **config):
+        self.name = name
+        self.config = config                    # concorrenza, rate, ... (nel report)
+        self.started = time.time()
+        self._clock = time.perf_counter()
+        self.requests = Counter()               # (host, status) -> n; status "errore" = rete/timeout
+        self.bytes = Counter()                  # host -> byte scritti
+        self.retries = Counter()                # host -> n
+        self.jobs = Counter()                   # esito del job -> n
+        self.latency = defaultdict(Histogram)   # host -> istogramma
+        self.in_flight = 0
+        self.queue = None                       # coda dei job (per la profondità)
+        self.limiter = None                     # HostLimiter (rate e breaker per host)
+        self.max_queue_depth = 0
+        self._runner = None
+        self._summary_task = None
+
+    # ---------------------- aggiornamenti ----------------------
+
+    def request_done(self, host, status, seconds, size=None):
+        self.requests[(host, str(status))] += 1
+        self.latency[host].observe(seconds)
+        if size:
+            self.bytes[host] += size
+
+    def request_failed(self, host, seconds):
+        self.requests[(host, "errore")] += 1
+        self.latency[host].observe(seconds)
+
+    def retry(self, host):
+        self.retries[host] += 1
+
+    def job_done(self, outcome):
+        self.jobs[outcome] += 1
+
+    def queue_depth(self):
+        depth = self.queue.qsize() if self.queue is not None else 0
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        return depth
+
+    # ------------------------- letture -------------------------
+
+    def snapshot(self):
+        """Stato corrente come dizionario (è anche il corpo di /status)."""
+        elapsed = max(time.perf_counter() - self._clock, 1e-9)
+        hosts = sorted({host for host, _ in self.requests} | set(self.bytes))
+        per_host = {}
+        for host in hosts:
+            statuses = {status: n for (h, status), n in self.requests.items() if h == host}
+            entry = {
+                "richieste": sum(statuses.values()),
+                "status": dict(sorted(statuses.items())),
+                "bytes": self.bytes[host],
+                "retry": self.retries[host],
+                "latenza": self.latency[host].summary(),
+            }
+            if self.limiter is not None and host in self.limiter.buckets:
+                bucket = self.limiter.buckets[host]
+                entry["rate"] = round(bucket.rate, 3)
+                entry["rate_configurato"] = round(bucket.max_rate, 3)
+            if self.limiter is not None and host in self.limiter.breakers:
+                breaker = self.limiter.breakers[host]
+                entry["breaker"] = breaker.state
+                entry["breaker_aperture"] = breaker.openings
+            per_host[host] = entry
+
+        total_requests = sum(self.requests.values())
+        total_bytes = sum(self.bytes.values())
+        return {
+            "nome": self.name,
+            "inizio": datetime.datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "secondi": round(elapsed, 1),
+            "richieste": total_requests,
+            "richieste_al_secondo": round(total_requests / elapsed, 2),
+            "bytes": total_bytes,
+            "mb_al_secondo": round(total_bytes / (1024 * 1024) / elapsed, 3),
+            "job": dict(self.jobs),
+            "job_al_secondo": round(sum(self.jobs.values()) / elapsed, 2),
+            "in_volo": self.in_flight,
+            "coda": self.queue_depth(),
+            "coda_massima": self.max_queue_depth,
+            "host": per_host,
+            "config": self.config,
+        }
+
+    def prometheus(self):
+        """Metriche nel formato testo di Prometheus (/metrics)."""
+        lines = [
+            "# TYPE crawl_requests_total counter",
+            *(f'crawl_requests_total{{host="{h}",status="{s}"}} {n}'
+              for (h, s), n in sorted(self.requests.items())),
+            "# TYPE crawl_bytes_total counter",
+            *(f'crawl_bytes_total{{host="{h}"}} {n}' for h, n in sorted(self.bytes.items())),
+            "# TYPE crawl_retries_total counter",
+            *(f'crawl_retries_total{{host="{h}"}} {n}' for h, n in sorted(self.retries.items())),
+            "# TYPE crawl_jobs_total counter",
+            *(f'crawl_jobs_total{{outcome="{o}"}} {n}' for o, n in sorted(self.jobs.items())),
+            "# TYPE crawl_fetch_seconds histogram",
+        ]
+        for host, hist in sorted(self.latency.items()):
+            for bound, count in hist.cumulative():
+                lines.append(f'crawl_fetch_seconds_bucket{{host="{host}",le="{bound}"}} {count}')
+            lines.append(f'crawl_fetch_seconds_sum{{host="{host}"}} {hist.total:.6f}')
+            lines.append(f'crawl_fetch_seconds_count{{host="{host}"}} {len(hist)}')
+        lines += [
+            "# TYPE crawl_queue_depth gauge",
+            f"crawl_queue_depth {self.queue_depth()}",
+            "# TYPE crawl_in_flight gauge",
+            f"crawl_in_flight {self.in_flight}",
+        ]
+        if self.limiter is not None:
+            lines.append("# TYPE crawl_host_rate gauge")
+            lines += [f'crawl_host_rate{{host="{h}"}} {b.rate:.4f}' for h, b in sorted(self.limiter.buckets.items())]
+            lines.append("# TYPE crawl_breaker_open gauge")
+            lines += [f'crawl_breaker_open{{host="{h}"}} {int(b.state != "chiuso")}'
+                      for h, b in sorted(self.limiter.breakers.items())]
+        return "\n".join(lines) + "\n"
+
+    def summary_line(self):
+        s = self.snapshot()
+        statuses = Counter()
+        for host in s["host"].values():
+            statuses.update(host["status"])
+        p95 = max((h["latenza"].get("p95_ms", 0) for h in s["host"].values()), default=0)
+        return (f"[CRAWL] {s['secondi']:6.0f}s | job {sum(s['job'].values())} ({s['job_al_secondo']}/s) | "
+                f"richieste {s['richieste']} ({s['richieste_al_secondo']}/s) | {s['mb_al_secondo']} MB/s | "
+                f"p95 {p95:.0f} ms | in volo {s['in_volo']} | coda {s['coda']} | "
+                f"status {dict(sorted(statuses.items()))}")
+
+    # ------------------- endpoint e riepilogo -------------------
+
+    async def start(self, queue=None, limiter=None, host=None, port=None, interval=None):
+        """Avvia endpoint di stato e riepilogo periodico nell'event loop corrente."""
+        from aiohttp import web
+
+        self.queue, self.limiter = queue, limiter
+        port = STATUS_PORT if port is None else port
+        interval = SUMMARY_INTERVAL if interval is None else interval
+
+        if port is not None:
+            async def status(request):
+                return web.json_response(self.snapshot())
+
+            async def metrics(request):
+                return web.Response(text=self.prometheus(), content_type="text/plain")
+
+            app = web.Application()
+            app.router.add_get("/status", status)
+            app.router.add_get("/metrics", metrics)
+            self._runner = web.AppRunner(app)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, host or STATUS_HOST, port)
+            try:
+                await site.start()
+                print(f"Stato del crawl: http://{host or STATUS_HOST}:{port}/status (JSON), /metrics (Prometheus)")
+            except OSError as e:    # porta occupata: il crawl continua senza endpoint
+                print(f"   ⚠ Endpoint di stato non avviato sulla porta {port}: {e}")
+                await self._runner.cleanup()
+                self._runner = None
+
+        if interval:
+            self._summary_task = asyncio.create_task(self._summaries(interval))
+
+    async def _summaries(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            print(self.summary_line())
+
+    async def stop(self):
+        if self._summary_task is not None:
+            self._summary_task.cancel()
+            self._summary_task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    # -------------------------- report --------------------------
+
+    def write_report(self, report_dir=REPORT_DIR, **extra):
+        """Report JSON finale della run; ritorna il percorso."""
+        os.makedirs(report_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(report_dir, f"crawl_{self.name}_{stamp}.json")
+        report = self.snapshot()
+        report.update(extra)
+        for host, hist in self.latency.items():
+            report["host"].setdefault(host, {})["istogramma_latenza"] = [
+                {"le": bound, "count": count} for bound, count in hist.cumulative()]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return path
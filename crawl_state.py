@@ -0,0 +1,243 @@
+# crawl_state.py
+# Stato del crawl in SQLite (al posto dei log CSV arxiv_log.csv / pmc_log.csv):
+# una riga per articolo con esito, tentativi, status HTTP, byte, latenza e
+# timestamp. Il controllo "già scaricato?" è un lookup sulla chiave primaria.
+#
+# - WAL: altri processi (es. un endpoint di stato) possono leggere mentre il
+#   crawler scrive
+# - un solo scrittore: la connessione appartiene al thread che la apre (il loop
+#   asyncio del downloader) e le scritture vengono raggruppate in transazioni
+import csv
+import datetime
+import os
+import sqlite3
+import time
+
+DB_PATH = "html_corpus/crawl_state.sqlite"
+COMMIT_EVERY = 200          # scritture per transazione
+COMMIT_INTERVAL = 5.0       # secondi massimi prima di un commit
+
+# Esiti di un articolo
+SCARICATO = "scaricato"
+NON_MODIFICATO = "non_modificato"   # 304 su una GET condizionale
+SCARTATO = "scartato"               # non corrisponde ai pattern, non va scaricato
+NON_TROVATO = "404"
+MANCANTE = "mancante"               # assente dalla risposta efetch del batch
+FALLITO = "fallito"
+IN_CODA = "in_coda"                 # selezionato dall'harvest, download non ancora concluso
+IMPORTATO = "importato"             # dai vecchi log CSV
+
+# Articoli da non richiedere più (gli altri vengono ritentati alla prossima esecuzione)
+DONE_STATUSES = (SCARICATO, NON_MODIFICATO, SCARTATO, NON_TROVATO, IMPORTATO)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    source       TEXT NOT NULL,
+    id           TEXT NOT NULL,
+    status       TEXT NOT NULL,
+    title        TEXT,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    http_status  INTEGER,
+    bytes        INTEGER,
+    latency      REAL,
+    first_seen   TEXT NOT NULL,
+    updated      TEXT NOT NULL,
+    PRIMARY KEY (source, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS items_status ON items (source, status);
+
+CREATE TABLE IF NOT EXISTS validators (
+    url            TEXT PRIMARY KEY,
+    etag           TEXT,
+    last_modified  TEXT,
+    updated        TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS cursors (
+    name      TEXT PRIMARY KEY,
+    position  INTEGER NOT NULL,
+    updated   TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS imports (
+    path   TEXT PRIMARY KEY,
+    mtime  REAL NOT NULL,
+    rows   INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+
+
+def connect(path=DB_PATH, readonly=False):
+    """Connessione SQLite in modalità WAL (readonly=True per i lettori)."""
+    if readonly:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")   # con WAL resta consistente anche dopo un crash
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class ValidatorStore:
+    """
+    ETag/Last-Modified per URL nella tabella validators, con l'interfaccia
+    del dizionario che async_download si aspetta (get / assegnazione).
+    """
+
+    def __init__(self, state):
+        self.state = state
+
+    def get(self, url, default=None):
+        row = self.state.conn.execute(
+            "SELECT etag, last_modified FROM validators WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return default
+        return {"etag": row[0], "last_modified": row[1]}
+
+    def __setitem__(self, url, value):
+        self.state.conn.execute(
+            "INSERT INTO validators (url, etag, last_modified, updated) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(url) DO UPDATE SET etag = excluded.etag, "
+            "last_modified = excluded.last_modified, updated = excluded.updated",
+            (url, value.get("etag"), value.get("last_modified"), _now()))
+        self.state._written()
+
+
+class CrawlState:
+    """
+    Stato del crawl. Da usare come context manager: alla chiusura le scritture
+    in sospeso vengono confermate.
+
+        with CrawlState() as state:
+            if not state.is_done("arxiv", arxiv_id):
+                ...
+                state.record("arxiv", arxiv_id, SCARICATO, http_status=200, size=n, latency=t)
+    """
+
+    def __init__(self, path=DB_PATH, commit_every=COMMIT_EVERY, commit_interval=COMMIT_INTERVAL):
+        self.path = path
+        self.conn = connect(path)
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        self.validators = ValidatorStore(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------- letture -------------------------
+
+    def get(self, source, item_id):
+        cur = self.conn.execute("SELECT * FROM items WHERE source = ? AND id = ?", (source, item_id))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return dict(zip([c[0] for c in cur.description], row))
+
+    def is_done(self, source, item_id):
+        row = self.conn.execute("SELECT status FROM items WHERE source = ? AND id = ?",
+                                (source, item_id)).fetchone()
+        return row is not None and row[0] in DONE_STATUSES
+
+    def with_status(self, source, statuses):
+        """(id, titolo) degli articoli di una sorgente con uno degli esiti indicati."""
+        marks = ", ".join("?" * len(statuses))
+        return self.conn.execute(
+            f"SELECT id, title FROM items WHERE source = ? AND status IN ({marks}) ORDER BY first_seen",
+            (source, *statuses)).fetchall()
+
+    def cursor(self, name):
+        """Posizione salvata di un harvest paginato (0 se non è mai partito)."""
+        row = self.conn.execute("SELECT position FROM cursors WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def counts(self, source=None):
+        """{status: numero di articoli} per una sorgente (o per tutte)."""
+        if source is None:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM items GROUP BY status")
+        else:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM items WHERE source = ? GROUP BY status",
+                                     (source,))
+        return dict(rows.fetchall())
+
+    # ------------------------- scritture -----------------------
+
+    def record(self, source, item_id, status, title=None, http_status=None, size=None, latency=None,
+               attempt=True):
+        """
+        Registra l'esito di un articolo. attempt=True (un tentativo di download)
+        incrementa 'attempts'; False per i cambi di stato senza richiesta (es. IN_CODA).
+        """
+        now = _now()
+        self.conn.execute(
+            "INSERT INTO items (source, id, status, title, attempts, http_status, bytes, latency, "
+            "first_seen, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(source, id) DO UPDATE SET status = excluded.status, "
+            "title = COALESCE(excluded.title, title), attempts = attempts + excluded.attempts, "
+            "http_status = excluded.http_status, bytes = excluded.bytes, "
+            "latency = excluded.latency, updated = excluded.updated",
+            (source, item_id, status, title, int(attempt), http_status, size, latency, now, now))
+        self._written()
+
+    def set_cursor(self, name, position):
+        self.conn.execute(
+            "INSERT INTO cursors (name, position, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET position = excluded.position, updated = excluded.updated",
+            (name, position, _now()))
+        self._written()
+
+    def _written(self):
+        self._pending += 1
+        if (self._pending >= self.commit_every
+                or time.monotonic() - self._last_commit >= self.commit_interval):
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    # ------------------------- import --------------------------
+
+    def import_csv(self, source, csv_path, status=IMPORTATO):
+        """
+        Importa un vecchio log CSV (righe id,titolo). Gli ID già presenti non
+        vengono toccati; un file già importato e non modificato viene saltato.
+        Ritorna il numero di righe lette.
+        """
+        if not os.path.exists(csv_path):
+            return 0
+        mtime = os.path.getmtime(csv_path)
+        done = self.conn.execute("SELECT mtime FROM imports WHERE path = ?", (str(csv_path),)).fetchone()
+        if done is not None and done[0] == mtime:
+            return 0
+
+        now = _now()
+        rows = 0
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                if not row or not row[0].strip():   # righe vuote o corrotte
+                    continue
+                title = row[1].strip() if len(row) > 1 else None
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO items (source, id, status, title, first_seen, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (source, row[0].strip(), status, title, now, now))
+                rows += 1
+        self.conn.execute("INSERT OR REPLACE INTO imports (path, mtime, rows) VALUES (?, ?, ?)",
+                          (str(csv_path), mtime, rows))
+        self.commit()
+        return rows
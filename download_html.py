@@ -1,11 +1,15 @@
+import aiohttp
 import arxiv
+import asyncio
+import os
+import queue
 import re
-import time
+import threading
 from pathlib import Path
-import requests
-import csv
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import xmltodict
+import async_download
+import crawl_metrics
+import crawl_state
 
 # ============================================================
 # ---------------------- CONFIG -----------------------------
@@ -13,9 +17,19 @@ import xmltodict
 
 DATASET = "pubmed"  # "arxiv" o "pubmed"
 MAX_RESULTS = 500
-DELAY = 5.0
-RETRY = 3
-MAX_THREADS = 3
+ARXIV_PAGE_SIZE = 1000  # risultati per richiesta all'API arXiv (massimo 2000)
+RETRY = 3               # tentativi per richiesta (attese: async_download.backoff_delay)
+MAX_CONCURRENCY = 16    # download in volo al massimo; il ritmo lo decide il rate limit per host
+
+# Con una API key NCBI il limite E-utilities passa da 3 a 10 richieste/s
+NCBI_API_KEY = os.environ.get("NCBI_API_KEY")
+
+# PMC: gli ID arrivano a pagine dall'history server (esearch usehistory=y)
+# e gli articoli vengono scaricati a gruppi con una sola efetch POST per gruppo
+EUTILS_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+PMC_PAGE_SIZE = 5000        # ID per pagina di esearch (massimo E-utilities: 10000)
+PMC_BATCH_SIZE = 100        # articoli per richiesta efetch
+PMC_MAX_RESULTS = None      # None = tutti i risultati della query
 
 # --------------------- QUERY -------------------------------
 ARXIV_QUERY = '(all:entity AND (all:resolution OR all:matching))'
@@ -32,9 +46,16 @@ PMC_DIR = OUTPUT_DIR / "pmc_html"
 ARXIV_DIR.mkdir(parents=True, exist_ok=True)
 PMC_DIR.mkdir(parents=True, exist_ok=True)
 
+# Stato del crawl (esiti, tentativi, ETag/Last-Modified) in SQLite;
+# i vecchi log CSV vengono importati alla prima esecuzione
+STATE_DB = OUTPUT_DIR / "crawl_state.sqlite"
 LOG_ARXIV = OUTPUT_DIR / "arxiv_log.csv"
 LOG_PMC = OUTPUT_DIR / "pmc_log.csv"
 
+# Con RECRAWL=True le pagine già scaricate vengono richieste di nuovo con una
+# GET condizionale (304 se non sono cambiate)
+RECRAWL = False
+
 # -------------------- HEADERS -----------------------------
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
@@ -53,6 +74,15 @@ PATTERNS_PMC = [
 ]
 
 
+def combine_patterns(patterns):
+    """Un'unica regex in alternativa: una sola scansione del testo per tutti i pattern."""
+    return re.compile("|".join(f"(?:{p.pattern})" for p in patterns), re.IGNORECASE)
+
+
+FILTER_ARXIV = combine_patterns(PATTERNS_ARXIV)
+FILTER_PMC = combine_patterns(PATTERNS_PMC)
+
+
 # ============================================================
 # ---------------- COMMON FUNCTIONS -------------------------
 # ============================================================
@@ -60,160 +90,345 @@ PATTERNS_PMC = [
 def matches_phrase(text: str, dataset: str) -> bool:
     if not text:
         return False
-    patterns = PATTERNS_ARXIV if dataset == "arxiv" else PATTERNS_PMC
-    return any(p.search(text) for p in patterns)
-
-
-def load_processed(log_file):
-    """Carica gli ID già scaricati evitando errori su righe vuote o corrotte."""
-    if not log_file.exists():
-        return set()
-
-    processed = set()
-    with open(log_file, newline='', encoding='utf-8') as f:
-        for row in csv.reader(f):
-            if row and row[0].strip():   # evita linee vuote o corrotte
-                processed.add(row[0].strip())
-    return processed
-
-
-def save_to_log(log_file, identifier: str, title: str):
-    with open(log_file, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow([identifier, title])
-
-
-def download_html(url: str, out_file: Path):
-    if out_file.exists():
-        return out_file
-    for attempt in range(1, RETRY + 1):
-        try:
-            r = requests.get(url, headers=HEADERS, timeout=20)
-            if r.status_code == 404:
-                return None
-            r.raise_for_status()
-            out_file.write_text(r.text, encoding="utf-8")
-            return out_file
-        except Exception as e:
-            print(f"   ⚠ Error downloading {url} (attempt {attempt}): {e}")
-            time.sleep(DELAY)
-    return None
+    pattern = FILTER_ARXIV if dataset == "arxiv" else FILTER_PMC
+    return pattern.search(text) is not None
+
+
+def open_state():
+    """Apre lo stato del crawl importando (una volta sola) i vecchi log CSV."""
+    state = crawl_state.CrawlState(str(STATE_DB))
+    for source, log_file in (("arxiv", LOG_ARXIV), ("pmc", LOG_PMC)):
+        rows = state.import_csv(source, log_file)
+        if rows:
+            print(f"Importati {rows} ID da {log_file}")
+    return state
+
+
+def http_outcome(status):
+    """Esito in crawl_state per lo status HTTP restituito da async_download."""
+    if status is None:
+        return crawl_state.FALLITO
+    if status == 304:
+        return crawl_state.NON_MODIFICATO
+    if status == 404:
+        return crawl_state.NON_TROVATO
+    return crawl_state.SCARICATO
+
+
+def crawl_config(rates=None, **extra):
+    """Parametri della run riportati nelle metriche (per confrontare run diverse)."""
+    return {
+        "max_concurrency": MAX_CONCURRENCY,
+        "max_per_host": async_download.MAX_PER_HOST,
+        "rate_per_host": rates or async_download.HOST_RATES,
+        "rate_default": async_download.DEFAULT_RATE,
+        "retry": async_download.RETRY,
+        **extra,
+    }
+
+
+def log_download(state, source, titles, label, directory=None, on_file=None):
+    """
+    Callback di async_download: stampa l'esito e lo registra nello stato del crawl.
+    on_file([percorsi]) riceve i file appena scaricati (es. pipeline.py); il
+    suo risultato viene restituito ad async_download, che lo attende se serve.
+    """
+    def on_done(identifier, status, info):
+        outcome = http_outcome(status)
+        tag = {crawl_state.FALLITO: "FAILED", crawl_state.NON_MODIFICATO: "SAME",
+               crawl_state.NON_TROVATO: "404"}.get(outcome, "OK")
+        print(f"[{tag}/{label}] {identifier}")
+        state.record(source, identifier, outcome, title=titles.pop(identifier, None),
+                     http_status=status, size=info.get("bytes"), latency=info.get("latenza"))
+        if on_file is not None and outcome == crawl_state.SCARICATO:
+            return on_file([str(directory / f"{identifier}.html")])
+    return on_done
 
 
 # ============================================================
 # --------------------- ARXIV ------------------------------
 # ============================================================
 
-def process_arxiv(result):
-    arxiv_id = result.get_short_id()
-    title = (result.title or "").strip()
-    summary = (result.summary or "").strip()
-
-    if matches_phrase(title, "arxiv") or matches_phrase(summary, "arxiv"):
-        print(f"[OK/ARXIV] {arxiv_id} — {title}")
-        url = f"https://arxiv.org/html/{arxiv_id}"
-        out_file = ARXIV_DIR / f"{arxiv_id}.html"
-        download_html(url, out_file)
-        save_to_log(LOG_ARXIV, arxiv_id, title)
-        return arxiv_id
-    else:
-        print(f"[NO/ARXIV] {arxiv_id}")
-        save_to_log(LOG_ARXIV, arxiv_id, title)
-        return None
+def harvest_arxiv(search, offset, out_q, stop, counts):
+    """
+    Thread di harvest dei metadati: pagina i risultati dell'API arXiv a partire
+    da 'offset' e applica il filtro sul testo. In out_q finiscono solo
+    (posizione, id, titolo) dei paper che corrispondono, più (posizione, None, None)
+    a fine pagina per far avanzare il cursore; None alla fine. Se i risultati
+    vengono letti tutti senza errori counts["completo"] diventa True.
+    """
+    client = arxiv.Client(page_size=ARXIV_PAGE_SIZE, num_retries=RETRY)
+    position = offset
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                out_q.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
 
+    try:
+        for result in client.results(search, offset=offset):
+            if stop.is_set():
+                return
+            position += 1
+            counts["letti"] += 1
+            title = (result.title or "").strip()
+            if FILTER_ARXIV.search(f"{title}\n{result.summary or ''}"):
+                counts["match"] += 1
+                put((position, result.get_short_id(), title))
+            if (position - offset) % ARXIV_PAGE_SIZE == 0:
+                put((position, None, None))
+        counts["completo"] = not stop.is_set()
+    except Exception as e:
+        print(f"   ⚠ arXiv harvest interrupted at position {position}: {type(e).__name__}: {e}")
+    finally:
+        put((position, None, None))
+        put(None)
+
+
+async def arxiv_jobs(search, state, titles, counts):
+    """
+    Job di download (id, url, file) per i paper selezionati dall'harvest.
+    Prima quelli rimasti in coda o falliti nell'esecuzione precedente, poi
+    l'harvest riparte dal cursore salvato: un crawl interrotto riprende a metà
+    dei risultati invece che dall'inizio. Quando l'harvest arriva in fondo il
+    cursore torna a 0: l'esecuzione successiva rilegge la ricerca (con i paper
+    nuovi) e salta quelli già scaricati.
+    """
+    # Il cursore è una posizione nei risultati: vale solo per la stessa query,
+    # lo stesso ordinamento e lo stesso max_results
+    cursor_name = (f"arxiv:{search.query}:{search.sort_by.value}:{search.sort_order.value}:"
+                   f"{search.max_results}")
+    seen = set()
+
+    def job(arxiv_id, title):
+        seen.add(arxiv_id)
+        titles[arxiv_id] = title
+        return arxiv_id, f"https://arxiv.org/html/{arxiv_id}", ARXIV_DIR / f"{arxiv_id}.html"
+
+    for arxiv_id, title in state.with_status("arxiv", (crawl_state.IN_CODA, crawl_state.FALLITO)):
+        yield job(arxiv_id, title)
+
+    offset = 0 if RECRAWL else state.cursor(cursor_name)
+    if search.max_results is not None and offset >= search.max_results:
+        offset = 0
+    if offset:
+        print(f"Ripresa dell'harvest arXiv dalla posizione {offset}")
+    harvested = queue.Queue(maxsize=2 * ARXIV_PAGE_SIZE)
+    stop = threading.Event()
+
+    def next_item():
+        # attesa a intervalli: se il crawl viene interrotto (stop) il thread
+        # dell'executor torna libero e asyncio.run può chiudersi
+        while not stop.is_set():
+            try:
+                return harvested.get(timeout=1)
+            except queue.Empty:
+                continue
+        return None
 
-def run_arxiv():
+    threading.Thread(target=harvest_arxiv, args=(search, offset, harvested, stop, counts),
+                     name="arxiv-harvest", daemon=True).start()
+    try:
+        while (item := await asyncio.to_thread(next_item)) is not None:
+            position, arxiv_id, title = item
+            if arxiv_id is not None and arxiv_id not in seen:
+                if not RECRAWL and state.is_done("arxiv", arxiv_id):
+                    print(f"[SKIP] {arxiv_id}")
+                elif (ARXIV_DIR / f"{arxiv_id}.html").exists() and not RECRAWL:
+                    state.record("arxiv", arxiv_id, crawl_state.SCARICATO, title=title, attempt=False)
+                else:
+                    # registrato prima di avanzare il cursore: se il crawl si interrompe
+                    # il paper viene ripreso dalla lista "in coda"
+                    state.record("arxiv", arxiv_id, crawl_state.IN_CODA, title=title, attempt=False)
+                    yield job(arxiv_id, title)
+            state.set_cursor(cursor_name, position)
+        if counts.get("completo"):
+            state.set_cursor(cursor_name, 0)
+    finally:
+        stop.set()
+
+
+def run_arxiv(on_file=None):
     print("\n=== ARXIV PROCESSING ===\n")
-    client = arxiv.Client()
     search = arxiv.Search(
         query=ARXIV_QUERY,
         max_results=MAX_RESULTS,
-        sort_by=arxiv.SortCriterion.Relevance
+        sort_by=arxiv.SortCriterion.Relevance,
+        sort_order=arxiv.SortOrder.Descending,
     )
-    processed = load_processed(LOG_ARXIV)
-    found = []
-    tasks = []
-
-    with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-        for res in client.results(search):
-            arxiv_id = res.get_short_id()
-            if arxiv_id in processed:
-                print(f"[SKIP] {arxiv_id}")
-                continue
-            tasks.append(executor.submit(process_arxiv, res))
-
-        for future in as_completed(tasks):
-            r = future.result()
-            if r:
-                found.append(r)
-    print(f"\nARXIV matched: {len(found)}")
+    titles = {}
+    counts = {"letti": 0, "match": 0}
+
+    # L'harvest dei metadati (API arXiv, una pagina ogni 3s) gira in un thread
+    # mentre i download HTML procedono (una richiesta ogni 3s verso arxiv.org)
+    metrics = crawl_metrics.CrawlMetrics("arxiv", **crawl_config())
+    with open_state() as state:
+        stats = async_download.run_downloads(
+            arxiv_jobs(search, state, titles, counts),
+            on_done=log_download(state, "arxiv", titles, "ARXIV", ARXIV_DIR, on_file),
+            concurrency=MAX_CONCURRENCY,
+            validators=state.validators,
+            metrics=metrics,
+        )
+    print(f"\nARXIV harvest: {counts['letti']} results read, {counts['match']} matched")
+    print(f"ARXIV matched: {stats['ok']} downloaded, {stats['non_modificati']} unchanged, "
+          f"{stats['404']} without HTML, "
+          f"{stats['falliti']} failed in {stats['secondi']:.0f}s")
+    print(f"Crawl report: {metrics.write_report(harvest=counts, esiti=stats)}")
 
 
 # ============================================================
 # --------------------- PMC -------------------------------
 # ============================================================
 
-def pmc_search(query, retmax=500):
-    """Cerca PMC Open Access e restituisce gli ID."""
-    url = (
-        "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-        f"?db=pmc&term={query}&retmode=json&retmax={retmax}"
-    )
-    r = requests.get(url, headers=HEADERS)
-    r.raise_for_status()
-    data = r.json()
-    return data.get("esearchresult", {}).get("idlist", [])
-
-
-def process_pmc(pmcid):
-    """Scarica HTML di un articolo PMC tramite efetch per evitare 403."""
-    out_file = PMC_DIR / f"{pmcid}.html"
-
-    if out_file.exists():
-        print(f"[SKIP/PMC] {pmcid} (already downloaded)")
-        return pmcid
-
-    url = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pmc&id={pmcid}&retmode=html"
-
-    for attempt in range(1, RETRY + 1):
-        try:
-            r = requests.get(url, headers=HEADERS, timeout=30)
-            if r.status_code == 404:
-                print(f"[404/PMC] {pmcid}")
-                return None
-            r.raise_for_status()
-            out_file.write_text(r.text, encoding="utf-8")
-            print(f"[OK/PMC] {pmcid}")
-            save_to_log(LOG_PMC, pmcid, pmcid)
-            time.sleep(DELAY)  # piccolo delay tra le richieste
-            return pmcid
-        except requests.HTTPError as e:
-            print(f"   ⚠ HTTP Error {pmcid} (attempt {attempt}): {e}")
-            time.sleep(DELAY)
-        except requests.RequestException as e:
-            print(f"   ⚠ Request error {pmcid} (attempt {attempt}): {e}")
-            time.sleep(DELAY)
-
-    print(f"[FAILED/PMC] {pmcid}")
-    return None
-
-
-def run_pmc():
-    print("\n=== PMC PROCESSING ===\n")
-    pmcids = pmc_search(PMC_QUERY, retmax=1000)[:500]
-    processed = load_processed(LOG_PMC)
-    found = []
-
-    # Scarica sequenzialmente per evitare 403
-    for pmcid in pmcids:
-        if pmcid in processed:
+# Un articolo nella risposta efetch (<pmc-articleset><article>...</article>...)
+# e il suo PMCID; i <sub-article> restano dentro l'articolo che li contiene
+PMC_ARTICLE_RE = re.compile(r"<article[\s>].*?</article>", re.S)
+PMC_ARTICLE_ID_RE = re.compile(r'<article-id pub-id-type="pmc(?:id)?">\s*(?:PMC)?(\d+)\s*</article-id>')
+
+
+def eutils_params(**params):
+    if NCBI_API_KEY:
+        params["api_key"] = NCBI_API_KEY
+    return params
+
+
+async def pmc_search(query, limiter, page_size=PMC_PAGE_SIZE, max_results=PMC_MAX_RESULTS):
+    """
+    Cerca PMC Open Access e restituisce (generatore asincrono) tutti gli ID, a pagine.
+    La prima esearch salva la query sull'history server (WebEnv/query_key);
+    le pagine successive rileggono quel risultato con retstart. Le esearch
+    passano da 'limiter', lo stesso HostLimiter delle efetch: insieme restano
+    nel limite E-utilities, e l'attesa di una pagina non blocca i download.
+    """
+    url = f"{EUTILS_URL}/esearch.fcgi"
+    params = eutils_params(db="pmc", term=query, usehistory="y", retmode="json",
+                           retstart=0, retmax=page_size)
+    total = None
+    retstart = 0
+    timeout = aiohttp.ClientTimeout(total=async_download.REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout, headers=async_download.HEADERS) as session:
+        while total is None or retstart < total:
+            response = await async_download.fetch_json(session, limiter, url, params=params)
+            result = response.get("esearchresult", {})
+            ids = result.get("idlist", [])
+            if total is None:
+                total = int(result.get("count", 0))
+                if max_results is not None:
+                    total = min(total, max_results)
+                print(f"PMC: {total} risultati")
+                # pagine successive dall'history server invece di rieseguire la query
+                params = eutils_params(db="pmc", term=f"#{result.get('querykey')}",
+                                       WebEnv=result.get("webenv"), usehistory="y",
+                                       retmode="json", retmax=page_size)
+            if not ids:
+                break
+            for pmcid in ids[:total - retstart]:
+                yield pmcid
+            retstart += len(ids)
+            params["retstart"] = retstart
+
+
+def split_pmc_articles(xml):
+    """Divide una risposta efetch in (pmcid, xml dell'articolo)."""
+    for match in PMC_ARTICLE_RE.finditer(xml):
+        article = match.group(0)
+        pmcid = PMC_ARTICLE_ID_RE.search(article)
+        if pmcid:
+            yield pmcid.group(1), article
+
+
+async def pmc_batches(pmcids, state, batch_size=PMC_BATCH_SIZE):
+    """
+    Job di download per async_download: un efetch POST ogni batch_size articoli
+    ancora da scaricare. La chiave del job è (file del batch, ID richiesti).
+    """
+    batch = []
+    n = 0
+    async for pmcid in pmcids:
+        if state.is_done("pmc", pmcid):
             print(f"[SKIP] {pmcid}")
             continue
-        r = process_pmc(pmcid)
-        if r:
-            found.append(r)
-
-    print(f"\nPMC matched: {len(found)}")
+        if (PMC_DIR / f"{pmcid}.html").exists():
+            print(f"[SKIP/PMC] {pmcid} (already downloaded)")
+            continue
+        batch.append(pmcid)
+        if len(batch) == batch_size:
+            n += 1
+            yield pmc_batch_job(n, batch)
+            batch = []
+    if batch:
+        yield pmc_batch_job(n + 1, batch)
+
+
+def pmc_batch_job(n, batch):
+    batch_file = PMC_DIR / f"_batch_{n:05d}.xml"
+    data = eutils_params(db="pmc", id=",".join(batch), retmode="xml")
+    return (batch_file, tuple(batch)), f"{EUTILS_URL}/efetch.fcgi", batch_file, data
+
+
+def save_pmc_batch(state, stats, on_file=None):
+    """
+    Callback: divide la risposta di un batch nei file dei singoli articoli
+    (passati a on_file, come in log_download).
+    """
+    def on_done(key, status, info):
+        batch_file, batch = key
+        if status is None or status == 404:
+            print(f"[FAILED/PMC] batch {batch_file.name} ({len(batch)} articoli)")
+            for pmcid in batch:
+                state.record("pmc", pmcid, crawl_state.FALLITO, http_status=status)
+            return
+        xml = batch_file.read_text(encoding="utf-8")
+        batch_file.unlink()
+        requested = set(batch)
+        saved = []
+        for pmcid, article in split_pmc_articles(xml):
+            if pmcid not in requested:
+                continue
+            requested.discard(pmcid)
+            data = article.encode("utf-8")
+            async_download.write_atomic(PMC_DIR / f"{pmcid}.html", [data])
+            saved.append(str(PMC_DIR / f"{pmcid}.html"))
+            # la latenza è quella della richiesta efetch dell'intero batch
+            state.record("pmc", pmcid, crawl_state.SCARICATO, http_status=status,
+                         size=len(data), latency=info.get("latenza"))
+            stats["articoli"] += 1
+        # ID senza articolo nella risposta (ritirati, non open access, ...):
+        # restano "mancanti", così la prossima esecuzione li riprova
+        for pmcid in sorted(requested):
+            print(f"[404/PMC] {pmcid}")
+            state.record("pmc", pmcid, crawl_state.MANCANTE, http_status=status)
+            stats["mancanti"] += 1
+        print(f"[OK/PMC] batch {batch_file.name}: {len(batch) - len(requested)}/{len(batch)} articoli")
+        if on_file is not None and saved:
+            return on_file(saved)
+    return on_done
+
+
+def run_pmc(on_file=None):
+    print("\n=== PMC PROCESSING ===\n")
+    found = {"articoli": 0, "mancanti": 0}
+
+    # Gli ID arrivano a pagine mentre i batch precedenti vengono già scaricati;
+    # il token bucket per host rispetta il limite E-utilities (3 richieste/s, 10/s con NCBI_API_KEY)
+    rates = async_download.eutils_rates(NCBI_API_KEY)
+    limiter = async_download.HostLimiter(rates)     # condiviso da esearch ed efetch
+    metrics = crawl_metrics.CrawlMetrics("pmc", **crawl_config(rates, batch_size=PMC_BATCH_SIZE))
+    with open_state() as state:
+        stats = async_download.run_downloads(
+            pmc_batches(pmc_search(PMC_QUERY, limiter), state),
+            on_done=save_pmc_batch(state, found, on_file),
+            limiter=limiter,
+            concurrency=MAX_CONCURRENCY,
+            metrics=metrics,
+        )
+    print(f"\nPMC matched: {found['articoli']} downloaded, {found['mancanti']} not found, "
+          f"{stats['falliti']} batches failed in {stats['secondi']:.0f}s")
+    print(f"Crawl report: {metrics.write_report(articoli=found, esiti=stats)}")
 
 
 
@@ -1,6 +1,36 @@
 # extract_tables.py
+# Estrazione delle tabelle (caption, corpo, citazioni, contesto) dalle pagine HTML.
+# Eseguito come script estrae le tabelle di tutto html_corpus in file JSONL
+# a shard, in parallelo e senza Elasticsearch.
+import glob
+import gzip
+import hashlib
+import json
+import os
 import re
-from bs4 import BeautifulSoup
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
+from bs4 import BeautifulSoup, SoupStrainer
+import html_document
+import instrumentation
+import parse_cache
+from html_document import as_soup, read_html
+
+# ============================================================
+# CONFIG (estrazione standalone)
+# ============================================================
+
+CORPUS_DIRS = [("html_corpus/arxiv_html", "arxiv"), ("html_corpus/pmc_html", "pubmed")]
+OUTPUT_DIR = "html_corpus/tables_jsonl"
+NUM_SHARDS = 64           # shard più piccoli = carico meglio bilanciato tra i worker
+COMPRESS_SHARDS = True    # shard_XXXXX.jsonl.gz invece di .jsonl
+EXTRACT_WORKERS = os.cpu_count() or 1
+EXTRACT_PARSER = "html.parser"
+EXTRACT_RESTRICTED = True  # albero ridotto (TableStrainer): meno memoria sulle pagine enormi
 
 # Stopwords minime per non-informative terms (puoi ampliarle se vuoi)
 STOPWORDS = {
@@ -9,6 +39,62 @@ STOPWORDS = {
     "we", "our", "their", "its", "be", "or", "it", "not", "may", "can"
 }
 
+# Citazioni di tabelle nel testo, in un'unica regex per tutte le tabelle:
+# "Table 2", "Tab. 3", "Tables 2–4", "Tables 1, 3 and 5", "Tables 2 to 4"
+MENTION_RE = re.compile(
+    r"\b(?P<word>[Tt]ables?|[Tt]ab\.?)\s*"
+    r"(?P<numbers>\d+(?:\s*(?:[-\u2013\u2014]|to\b|and\b|&|,)\s*\d+)*)\b"
+)
+MENTION_SEP_RE = re.compile(r"\s*([-\u2013\u2014]|to|and|&|,)\s*")
+RANGE_SEPARATORS = {"-", "\u2013", "\u2014", "to"}
+# Intervalli ed elenchi con salti più lunghi sono quasi sempre falsi positivi
+# (es. "Table 1-2020", "Tables 1 and 2020 data")
+MAX_MENTION_RANGE = 50
+
+# Valore numerico di una cella: "1.52", "−0.3", "1,234", "12.5%", "<0.001",
+# "1.52 (1.10–2.10)" -> si prende il valore principale e si ignora l'intervallo
+CELL_NUMBER_RE = re.compile(
+    r"^[<>≤≥~]?\s*([-+\u2212\u2013]?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?|[-+\u2212]?\.\d+)"
+    r"\s*%?\s*(?:[(\[].*)?$"
+)
+MAX_SPAN = 100           # rowspan/colspan assurdi (es. colspan="1000") vengono limitati
+NUMERIC_COLUMN_RATIO = 0.5  # quota minima di celle numeriche per una colonna "numerica"
+
+
+class TableStrainer(SoupStrainer):
+    """
+    Filtro di parsing per la sola estrazione delle tabelle: costruisce soltanto
+    i <p>, le <table> e i contenitori delle tabelle (es. <div class="table-wrap">
+    di PMC, <figure class="ltx_table"> di arXiv) con la caption vicina.
+    Tutto il resto della pagina (menu, riferimenti, script, ...) non diventa
+    mai un nodo dell'albero, quindi memoria e tempo non crescono con la pagina.
+    """
+
+    KEEP = {"p", "table"}
+    WRAPPERS = {"div", "figure", "section"}
+
+    def __init__(self):
+        super().__init__()
+
+    @classmethod
+    def keep(cls, name, attrs):
+        if name in cls.KEEP:
+            return True
+        if name not in cls.WRAPPERS:
+            return False
+        css = (attrs or {}).get("class") or ""
+        if not isinstance(css, str):
+            css = " ".join(css)
+        return "table" in css.lower()
+
+    # bs4 >= 4.13
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return self.keep(name, attrs)
+
+    # bs4 < 4.13
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        return self.keep(markup_name, markup_attrs)
+
 
 def tokenize(text):
     """Tokenizzazione semplice + rimozione stopwords e numeri."""
@@ -30,6 +116,73 @@ def extract_paragraphs(soup):
     return paragraphs
 
 
+def build_paragraph_postings(paragraphs):
+    """
+    Indice invertito dei paragrafi: termine -> lista (crescente) degli indici
+    dei paragrafi che lo contengono. Ogni paragrafo viene tokenizzato UNA
+    sola volta per documento, invece che una volta per ogni tabella.
+    """
+    postings = defaultdict(list)
+    for pid, par in enumerate(paragraphs):
+        for term in set(tokenize(par)):
+            postings[term].append(pid)
+    return postings
+
+
+def find_context_candidates(key_terms, postings, min_shared=2):
+    """
+    Indici (in ordine) dei paragrafi con almeno 'min_shared' termini in comune
+    con key_terms, contando le occorrenze nelle posting list dei soli termini
+    della tabella: il costo dipende da quanti paragrafi li contengono, non da
+    quanti paragrafi ha il paper.
+    """
+    shared = defaultdict(int)
+    for term in key_terms:
+        for pid in postings.get(term, ()):
+            shared[pid] += 1
+    return sorted(pid for pid, count in shared.items() if count >= min_shared)
+
+
+def parse_mention_numbers(text, plural=True):
+    """
+    Numeri di tabella citati da un match di MENTION_RE:
+    "2" -> {2}, "2–4" -> {2, 3, 4}, "1, 3 and 5" -> {1, 3, 5}.
+    Ogni numero deve superare il precedente di al più MAX_MENTION_RANGE: il
+    primo che non lo fa chiude la citazione ("1 and 2020" -> {1}). Con
+    plural=False ("Table", non "Tables") un elenco non è una citazione:
+    "Table 2, 5 patients" -> {2}.
+    """
+    parts = MENTION_SEP_RE.split(text)
+    numbers = {int(parts[0])}
+    for i in range(1, len(parts) - 1, 2):
+        prev, sep, num = int(parts[i - 1]), parts[i], int(parts[i + 1])
+        if not 0 < num - prev <= MAX_MENTION_RANGE:
+            break
+        if sep in RANGE_SEPARATORS:
+            numbers.update(range(prev, num + 1))
+        elif plural:
+            numbers.add(num)
+        else:
+            break
+    return numbers
+
+
+def find_table_mentions(paragraphs):
+    """
+    Scansiona ogni paragrafo UNA volta con MENTION_RE e ritorna
+    numero tabella -> indici (in ordine) dei paragrafi che la citano.
+    Il costo dipende dal numero di paragrafi, non da paragrafi × tabelle.
+    """
+    mentions = defaultdict(list)
+    for pid, par in enumerate(paragraphs):
+        cited = set()
+        for m in MENTION_RE.finditer(par):
+            cited |= parse_mention_numbers(m.group("numbers"), plural=m.group("word").lower() == "tables")
+        for num in cited:
+            mentions[num].append(pid)
+    return mentions
+
+
 def find_caption_for_table(table_tag):
     """
     Cerca la caption di una tabella:
@@ -41,9 +194,11 @@ def find_caption_for_table(table_tag):
         return cap.get_text(" ", strip=True)
 
     # Alcuni HTML (es. PMC) mettono la caption fuori, es. <div class="caption">
-    # Proviamo a vedere il genitore o il fratello
+    # Proviamo a vedere il genitore o il fratello.
+    # Se il genitore è la radice (albero ridotto, o frammento HTML) la ricerca
+    # coprirebbe tutta la pagina e troverebbe la caption di un'altra tabella.
     parent = table_tag.parent
-    if parent:
+    if parent and not isinstance(parent, BeautifulSoup):
         cap_div = parent.find("div", class_=re.compile("caption", re.I))
         if cap_div:
             return cap_div.get_text(" ", strip=True)
@@ -52,6 +207,138 @@ def find_caption_for_table(table_tag):
     return ""
 
 
+def parse_number(text):
+    """Valore numerico di una cella (float) o None se la cella non è un numero."""
+    m = CELL_NUMBER_RE.match(text.strip())
+    if not m:
+        return None
+    num = m.group(1).replace(",", "").replace("\u2212", "-").replace("\u2013", "-")
+    try:
+        return float(num)
+    except ValueError:
+        return None
+
+
+def _span(cell, attr):
+    """Valore di rowspan/colspan (1 se assente, non valido o 0)."""
+    try:
+        value = int(cell.get(attr, 1))
+    except (TypeError, ValueError):
+        return 1
+    return min(max(value, 1), MAX_SPAN)
+
+
+def table_grid(table_tag):
+    """
+    Griglia rettangolare delle celle della tabella, con rowspan/colspan
+    espansi (la cella viene ripetuta in ogni posizione che copre).
+    Ritorna (grid, head): testi delle celle e, per ogni cella, se è
+    un'intestazione (<th> o riga dentro <thead>).
+    """
+    grid, head = [], []
+    carry = {}  # colonna -> [righe rimanenti, testo, intestazione] dei rowspan aperti
+    for tr in table_tag.find_all("tr"):
+        cells = tr.find_all(["td", "th"], recursive=False)
+        in_thead = tr.find_parent("thead") is not None
+        row, flags = [], []
+        col = ci = 0
+        while ci < len(cells) or (carry and max(carry) >= col):
+            if col in carry:
+                left, text, is_head = carry[col]
+                if left <= 1:
+                    del carry[col]
+                else:
+                    carry[col][0] = left - 1
+            elif ci < len(cells):
+                cell = cells[ci]
+                ci += 1
+                text = cell.get_text(" ", strip=True)
+                is_head = in_thead or cell.name == "th"
+                rowspan = _span(cell, "rowspan")
+                for _ in range(_span(cell, "colspan")):
+                    row.append(text)
+                    flags.append(is_head)
+                    if rowspan > 1:
+                        carry[col] = [rowspan - 1, text, is_head]
+                    col += 1
+                continue
+            else:
+                # buco nella riga prima di un rowspan aperto più a destra
+                text, is_head = "", False
+            row.append(text)
+            flags.append(is_head)
+            col += 1
+        if row:
+            grid.append(row)
+            head.append(flags)
+
+    width = max((len(r) for r in grid), default=0)
+    for row, flags in zip(grid, head):
+        row.extend([""] * (width - len(row)))
+        flags.extend([False] * (width - len(flags)))
+    return grid, head
+
+
+def detect_header_rows(grid, head):
+    """
+    Numero di righe di intestazione in cima alla griglia:
+    1) righe composte solo da <th> (o dentro <thead>)
+    2) altrimenti, la prima riga se non contiene numeri mentre le righe
+       sotto sì (tabelle che usano <td> anche per le intestazioni)
+    """
+    n = 0
+    for row, flags in zip(grid, head):
+        cells = [is_head for text, is_head in zip(row, flags) if text]
+        if not cells or not all(cells):
+            break
+        n += 1
+    if n or len(grid) < 2:
+        return n
+    first_numeric = any(parse_number(text) is not None for text in grid[0] if text)
+    below_numeric = any(parse_number(text) is not None for row in grid[1:] for text in row if text)
+    return 1 if not first_numeric and below_numeric else 0
+
+
+def detect_header_column(head, header_rows, columns):
+    """
+    True se la prima colonna contiene le etichette delle righe:
+    tutte <th> nel corpo, oppure testuale mentre almeno un'altra colonna è numerica.
+    """
+    if not columns:
+        return False
+    body_flags = [flags[0] for flags in head[header_rows:]]
+    if body_flags and all(body_flags):
+        return True
+    return not columns[0]["numeric"] and any(c["numeric"] for c in columns[1:])
+
+
+def build_columns(grid, header_rows):
+    """
+    Rappresentazione a colonne della tabella (compatta, una voce per colonna):
+    {"name": intestazione, "values": [celle], "numeric": bool, "numbers": [float]}
+    'numbers' è presente solo per le colonne numeriche ed è allineato a 'values'
+    (None dove la cella non è un numero).
+    """
+    columns = []
+    body = grid[header_rows:]
+    for j in range(len(grid[0]) if grid else 0):
+        # intestazioni su più righe (o espanse da colspan): testi distinti in ordine
+        names = []
+        for row in grid[:header_rows]:
+            if row[j] and row[j] not in names:
+                names.append(row[j])
+        values = [row[j] for row in body]
+        numbers = [parse_number(v) if v else None for v in values]
+        filled = [v for v in values if v]
+        parsed = [x for x in numbers if x is not None]
+        numeric = bool(parsed) and len(parsed) >= NUMERIC_COLUMN_RATIO * len(filled)
+        column = {"name": " / ".join(names), "values": values, "numeric": numeric}
+        if numeric:
+            column["numbers"] = numbers
+        columns.append(column)
+    return columns
+
+
 def guess_table_number(table_tag, index_fallback):
     """
     Cerca di indovinare il numero della tabella (per costruire 'Table 1', ...).
@@ -76,9 +363,14 @@ def guess_table_number(table_tag, index_fallback):
     return str(index_fallback)
 
 
-def extract_tables_from_html(html: str, paper_id: str):
+def extract_tables_from_html(html, paper_id: str, parser: str = None, restricted: bool = False):
     """
     Estrae tutte le tabelle dal documento HTML con il loro contesto.
+    'html' può essere la stringa HTML, un albero BeautifulSoup già costruito
+    o un ParsedDocument (in questo caso la pagina non viene ri-parsata).
+    'parser' sceglie il backend (vedi html_document.PARSER_BACKENDS) quando
+    'html' è una stringa; con restricted=True la stringa viene parsata
+    costruendo solo i sottoalberi utili alle tabelle (vedi TableStrainer).
     Ritorna una lista di dict:
     {
       "paper_id": ...,
@@ -86,13 +378,19 @@ def extract_tables_from_html(html: str, paper_id: str):
       "caption": ...,
       "body": ...,
       "mentions": [...],
-      "context_paragraphs": [...]
+      "context_paragraphs": [...],
+      "n_rows": ..., "n_cols": ..., "header_rows": ..., "header_column": ...,
+      "columns": [{"name": ..., "values": [...], "numeric": ..., "numbers": [...]}]
     }
     """
-    soup = BeautifulSoup(html, "html.parser")
+    soup = as_soup(html, parser=parser, parse_only=TableStrainer() if restricted else None)
 
     # 1) prendi tutti i paragrafi del paper una volta sola
+    t = instrumentation.checkpoint()
     paragraphs = extract_paragraphs(soup)
+    postings = build_paragraph_postings(paragraphs)
+    mention_index = find_table_mentions(paragraphs)
+    t = instrumentation.record("extract_tables.paragrafi", t)
 
     # 2) trova tutte le <table>
     tables = []
@@ -111,29 +409,28 @@ def extract_tables_from_html(html: str, paper_id: str):
                 rows_text.append(row_txt)
         body_text = " ".join(rows_text) or table_tag.get_text(" ", strip=True)
 
-        # MENTIONS: paragrafi che citano esplicitamente "Table X" o "Tab. X"
-        mention_patterns = [
-            re.compile(rf"\b[Tt]able\s*{table_num}\b"),
-            re.compile(rf"\b[Tt]ab\.?\s*{table_num}\b"),
-        ]
-        mentions = []
-        for par in paragraphs:
-            if any(p.search(par) for p in mention_patterns):
-                mentions.append(par)
+        # STRUTTURA: griglia delle celle, intestazioni e colonne (numeriche)
+        grid, head = table_grid(table_tag)
+        header_rows = detect_header_rows(grid, head)
+        columns = build_columns(grid, header_rows)
+        header_column = detect_header_column(head, header_rows, columns)
+
+        # MENTIONS: paragrafi che citano esplicitamente "Table X", "Tab. X"
+        # o un intervallo/elenco che include X (es. "Tables 2–4")
+        mention_ids = mention_index.get(int(table_num), ())
+        mentions = [paragraphs[pid] for pid in mention_ids]
 
         # CONTEXT_PARAGRAPHS:
         # paragrafi che contengono termini (informativi) presenti in caption/body
         key_terms = set(tokenize(caption) + tokenize(body_text))
         context_paragraphs = []
         if key_terms:
-            for par in paragraphs:
-                # Evita di duplicare i paragrafi che sono già nelle mentions
-                if par in mentions:
-                    continue
-                par_terms = set(tokenize(par))
-                # soglia minimale: almeno 2 termini in comune
-                if len(key_terms & par_terms) >= 2:
-                    context_paragraphs.append(par)
+            # Evita di duplicare i paragrafi che sono già nelle mentions
+            mentioned = {paragraphs[pid] for pid in mention_ids}
+            # soglia minimale: almeno 2 termini in comune
+            for pid in find_context_candidates(key_terms, postings, min_shared=2):
+                if paragraphs[pid] not in mentioned:
+                    context_paragraphs.append(paragraphs[pid])
 
         tables.append({
             "paper_id": paper_id,
@@ -142,6 +439,204 @@ def extract_tables_from_html(html: str, paper_id: str):
             "body": body_text,
             "mentions": mentions,
             "context_paragraphs": context_paragraphs,
+            "n_rows": len(grid) - header_rows,
+            "n_cols": len(columns),
+            "header_rows": header_rows,
+            "header_column": header_column,
+            "columns": columns,
         })
 
+    instrumentation.record("extract_tables.tabelle", t)
     return tables
+
+
+# ============================================================
+# ESTRAZIONE STANDALONE -> JSONL A SHARD
+# ============================================================
+
+def shard_of(file_path, num_shards=NUM_SHARDS):
+    """Shard di un file: hash stabile del percorso (non dipende da PYTHONHASHSEED)."""
+    digest = hashlib.md5(file_path.encode("utf-8")).hexdigest()
+    return int(digest, 16) % num_shards
+
+
+def plan_shards(corpus_dirs=CORPUS_DIRS, num_shards=NUM_SHARDS):
+    """shard -> lista ordinata di (file, source) dei file HTML del corpus."""
+    shards = defaultdict(list)
+    for directory, source in corpus_dirs:
+        for file in sorted(glob.glob(os.path.join(directory, "*.html"))):
+            shards[shard_of(file, num_shards)].append((file, source))
+    return dict(sorted(shards.items()))
+
+
+# shard_00042.jsonl[.gz] / shard_00042.done / shard_00042.jsonl[.gz][.<pid>].tmp
+SHARD_FILE_RE = re.compile(r"^shard_(\d{5})\.(?:jsonl|jsonl\.gz|done)$")
+SHARD_TMP_RE = re.compile(r"^shard_\d{5}\..*\.tmp$")
+
+
+@lru_cache(maxsize=None)
+def extraction_version():
+    """Versione del codice di estrazione (questo modulo + html_document)."""
+    return parse_cache.code_version(sys.modules[__name__], html_document)
+
+
+def shard_fingerprint(files, parser=EXTRACT_PARSER, restricted=EXTRACT_RESTRICTED):
+    """
+    Impronta di uno shard: percorsi, dimensioni e mtime dei file, backend di
+    parsing, albero ridotto e versione del codice di estrazione. Se uno di
+    questi cambia lo shard va rigenerato.
+    """
+    h = hashlib.sha1(f"{parser}\0{restricted}\0{extraction_version()}\n".encode("utf-8"))
+    for file, source in files:
+        st = os.stat(file)
+        h.update(f"{file}\0{source}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def shard_paths(output_dir, shard, compress=COMPRESS_SHARDS):
+    """(file JSONL dello shard, sidecar .done che ne certifica il completamento)."""
+    base = os.path.join(output_dir, f"shard_{shard:05d}")
+    return base + (".jsonl.gz" if compress else ".jsonl"), base + ".done"
+
+
+def shard_is_done(output_dir, shard, fingerprint, compress=COMPRESS_SHARDS):
+    """True se lo shard è già stato scritto per intero con gli stessi file in input."""
+    out_path, done_path = shard_paths(output_dir, shard, compress)
+    try:
+        with open(done_path, encoding="utf-8") as f:
+            done = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return done.get("fingerprint") == fingerprint and os.path.exists(out_path)
+
+
+def remove_stale_shards(output_dir, shards, compress=COMPRESS_SHARDS):
+    """
+    Elimina da output_dir i file di shard che non fanno parte del piano
+    corrente (NUM_SHARDS cambiato, shard rimasti senza file, compressione
+    cambiata): altrimenti le loro tabelle resterebbero duplicate o già cancellate.
+    Elimina anche i file temporanei lasciati da worker terminati a metà.
+    Ritorna il numero di file eliminati.
+    """
+    keep = {os.path.basename(path) for shard in shards for path in shard_paths(output_dir, shard, compress)}
+    removed = 0
+    for name in os.listdir(output_dir):
+        if SHARD_TMP_RE.match(name) or (SHARD_FILE_RE.match(name) and name not in keep):
+            os.remove(os.path.join(output_dir, name))
+            removed += 1
+    return removed
+
+
+def _extract_shard(shard, files, output_dir, compress, parser, fingerprint, restricted=EXTRACT_RESTRICTED):
+    """
+    Unità di lavoro dei worker: estrae le tabelle dei file di uno shard e le
+    scrive (una per riga) in un file temporaneo, rinominato solo a fine shard.
+    Il sidecar .done viene scritto per ultimo: uno shard interrotto viene rifatto.
+    """
+    out_path, done_path = shard_paths(output_dir, shard, compress)
+    # nome fisso per shard: un tentativo successivo sovrascrive quello di un worker morto
+    tmp_path = f"{out_path}.tmp"
+    opener = gzip.open if compress else open
+    n_tables = 0
+    errors = []
+    start = time.perf_counter()
+
+    try:
+        with opener(tmp_path, "wt", encoding="utf-8") as out:
+            for file, source in files:
+                try:
+                    html = read_html(file)
+                    if html is None:
+                        errors.append(file)
+                        continue
+                    tables = extract_tables_from_html(html, paper_id=Path(file).stem,
+                                                      parser=parser, restricted=restricted)
+                except Exception as e:
+                    errors.append(f"{file}: {type(e).__name__}: {e}")
+                    continue
+                for position, table in enumerate(tables):
+                    record = dict(table, file_path=file, source=source, position=position)
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    n_tables += 1
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    done = {
+        "shard": shard,
+        "fingerprint": fingerprint,
+        "files": len(files),
+        "tables": n_tables,
+        "errors": errors,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    with open(done_path, "w", encoding="utf-8") as f:
+        json.dump(done, f, ensure_ascii=False, indent=2)
+    instrumentation.drain()  # i tempi per stadio qui non servono: evita che si accumulino
+    return done
+
+
+def extract_corpus(corpus_dirs=CORPUS_DIRS, output_dir=OUTPUT_DIR, num_shards=NUM_SHARDS,
+                   workers=EXTRACT_WORKERS, compress=COMPRESS_SHARDS, parser=EXTRACT_PARSER,
+                   restricted=EXTRACT_RESTRICTED):
+    """
+    Estrae le tabelle di tutto il corpus in output_dir/shard_XXXXX.jsonl[.gz],
+    uno shard per task del process pool. Riprende da dove si era interrotta:
+    gli shard con sidecar .done e impronta invariata vengono saltati, quelli
+    che non fanno più parte del piano vengono eliminati.
+    Ritorna le statistiche aggregate.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    shards = plan_shards(corpus_dirs, num_shards)
+    removed = remove_stale_shards(output_dir, shards, compress)
+    if removed:
+        print(f"Eliminati {removed} file di shard obsoleti o temporanei")
+
+    todo = []
+    skipped = 0
+    for shard, files in shards.items():
+        fingerprint = shard_fingerprint(files, parser, restricted)
+        if shard_is_done(output_dir, shard, fingerprint, compress):
+            skipped += 1
+        else:
+            todo.append((shard, files, fingerprint))
+
+    total_files = sum(len(files) for files in shards.values())
+    print(f"File: {total_files}, shard: {len(shards)} (già completati: {skipped}, da fare: {len(todo)})")
+
+    stats = {"shard": len(todo), "saltati": skipped, "file": 0, "tabelle": 0, "errori": 0}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(_extract_shard, shard, files, output_dir, compress, parser, fingerprint,
+                        restricted): shard
+            for shard, files, fingerprint in todo
+        }
+        for i, future in enumerate(as_completed(futures), start=1):
+            shard = futures[future]
+            try:
+                done = future.result()
+            except Exception as e:  # es. worker terminato in modo anomalo: lo shard verrà rifatto
+                print(f"❌ Shard {shard}: {type(e).__name__}: {e}")
+                stats["errori"] += 1
+                continue
+            stats["file"] += done["files"]
+            stats["tabelle"] += done["tables"]
+            stats["errori"] += len(done["errors"])
+            print(f"[{i}/{len(todo)}] shard {shard:05d}: {done['files']} file, "
+                  f"{done['tables']} tabelle in {done['seconds']:.1f}s")
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(f"\nCompletato in {elapsed:.1f}s ({stats['file'] / elapsed:.1f} file/s): "
+          f"{stats['tabelle']} tabelle, {stats['errori']} errori -> {output_dir}")
+    return stats
+
+
+def main():
+    extract_corpus()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# html_document.py
+from pathlib import Path
+from bs4 import BeautifulSoup
+from instrumentation import stage
+
+# Backend di parsing usato da BeautifulSoup:
+# - "html.parser": puro Python, sempre disponibile, gestisce bene i tag mal formattati
+# - "lxml": tokenizer in C (libxml2), molto più veloce; richiede 'pip install lxml'
+PARSER_BACKENDS = ("html.parser", "lxml")
+HTML_PARSER = "html.parser"
+
+
+def check_parser(parser):
+    """Valida il nome del backend (None = default HTML_PARSER)."""
+    parser = parser or HTML_PARSER
+    if parser not in PARSER_BACKENDS:
+        raise ValueError(f"Backend di parsing sconosciuto: {parser!r} (disponibili: {', '.join(PARSER_BACKENDS)})")
+    return parser
+
+
+def available_parsers():
+    """Backend effettivamente installati in questo ambiente."""
+    available = ["html.parser"]
+    try:
+        import lxml  # noqa: F401
+        available.append("lxml")
+    except ImportError:
+        pass
+    return available
+
+
+class ParsedDocument:
+    """
+    Documento HTML letto e parsato UNA sola volta.
+    Lo stesso oggetto viene passato a parse_html (metadati/paragrafi)
+    e a extract_tables_from_html (tabelle), evitando di rileggere il file
+    e di costruire due alberi BeautifulSoup per la stessa pagina.
+    """
+
+    __slots__ = ("filepath", "html", "soup", "parser")
+
+    def __init__(self, html: str, filepath: str = None, parser: str = None):
+        self.filepath = filepath
+        self.html = html
+        self.parser = check_parser(parser)
+        with stage("soup"):
+            self.soup = BeautifulSoup(html, self.parser)
+
+
+def decode_html(raw: bytes) -> str:
+    """
+    Decodifica i byte di un file come Path.read_text(encoding="utf-8",
+    errors="ignore"), compresa la normalizzazione dei fine riga.
+    """
+    return raw.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def read_html(filepath: str):
+    """Legge il testo di un file HTML senza parsarlo. Ritorna None se non è leggibile."""
+    try:
+        with stage("io"):
+            return Path(filepath).read_text(encoding="utf-8", errors="ignore")
+    except Exception as e:
+        print(f"Errore nella lettura del file {filepath}: {e}")
+        return None
+
+
+def load_document(filepath: str, parser: str = None):
+    """Legge e parsa un file HTML. Ritorna None se il file non è leggibile."""
+    html = read_html(filepath)
+    if html is None:
+        return None
+    return ParsedDocument(html, filepath, parser=parser)
+
+
+def as_soup(source, parser: str = None, parse_only=None):
+    """
+    Normalizza l'input delle funzioni di estrazione: accetta una stringa HTML,
+    un albero BeautifulSoup già costruito o un ParsedDocument.
+    'parser' e 'parse_only' (uno SoupStrainer: costruisce solo i sottoalberi
+    che gli corrispondono) vengono usati solo quando bisogna parsare una stringa.
+    """
+    if isinstance(source, ParsedDocument):
+        return source.soup
+    if isinstance(source, BeautifulSoup):
+        return source
+    with stage("soup"):
+        return BeautifulSoup(source, check_parser(parser), parse_only=parse_only)
@@ -370,17 +370,76 @@ import glob
 import hashlib
 import re
 import datetime
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 from bs4 import BeautifulSoup, element
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, helpers
 from pathlib import Path
+import extract_tables
+import html_document
 from extract_tables import extract_tables_from_html
+from html_document import ParsedDocument, decode_html, load_document
+import instrumentation
+import near_duplicates
+import parse_cache
 
 # ============================================================
 # 1. CONNESSIONE ELASTICSEARCH
 # ============================================================
 
 ES = Elasticsearch("http://localhost:9200")
+
+# Nomi letti da web_app e search_cli: sono ALIAS che puntano all'indice fisico
+# versionato corrente (es. research_articles_v2-20250101120000)
 INDEX_NAME = "research_articles_v2"
+TABLES_INDEX_NAME = "research_tables"
+INDEX_REPLICAS = 1                      # repliche ripristinate dopo il caricamento
+# Ricostruzione: documenti falliti (rifiutati da ES o file con errori di
+# parsing) oltre i quali lo swap degli alias viene annullato
+REBUILD_MAX_FAILURES = 0
+FORCEMERGE_TIMEOUT = 3600               # secondi: il force-merge di un indice grande è lento
+
+# Profilo di memorizzazione degli articoli:
+# - "completo": content_full è indicizzato e salvato anche in _source
+# - "compatto": content_full resta cercabile ma è escluso da _source (quasi
+#   tutto il suo testo è già in 'paragraphs'), dimezzando circa l'indice
+STORAGE_PROFILE = "completo"
+
+# Parametri del caricamento bulk (una richiesta HTTP ogni N documenti)
+BULK_CHUNK_DOCS = 500                   # documenti massimi per richiesta bulk
+BULK_CHUNK_BYTES = 20 * 1024 * 1024     # byte massimi per richiesta bulk
+BULK_MAX_RETRIES = 3                    # tentativi sui 429 (coda ES piena)
+
+# Parsing parallelo: con 1 worker il parsing resta nel processo principale
+PARSE_WORKERS = os.cpu_count() or 1
+PARSE_QUEUE_SIZE = 64                   # file in lavorazione al massimo (memoria costante)
+
+# Backend HTML (vedi html_document.PARSER_BACKENDS): "lxml" è molto più veloce di "html.parser"
+PARSER_BACKEND = "html.parser"
+
+# Strumentazione: report JSON dei tempi per stadio a fine index_directory
+REPORT_DIR = "reports"
+PROFILE_SLOWEST_FILES = 0               # N file più lenti da ri-eseguire sotto cProfile (0 = no)
+
+# Cache su disco di parse_html + extract_tables (chiave: hash del contenuto + backend)
+USE_PARSE_CACHE = True
+PARSE_CACHE_DIR = "html_corpus/.parse_cache"
+PARSE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Manifest dei file già indicizzati (usato dalla modalità incrementale)
+MANIFEST_PATH = "html_corpus/index_manifest.json"
+
+# Quasi-duplicati (versioni dello stesso paper, articoli PMC sovrapposti):
+# - None: nessun controllo
+# - "link": tutto viene indicizzato, ma i duplicati hanno duplicate_of = ID
+#   dell'originale (i client li nascondono di default)
+# - "collapse": i duplicati non vengono indicizzati (restano solo nel manifest)
+# Le firme MinHash stanno nel manifest, quindi valgono anche tra run diverse.
+NEAR_DUP_POLICY = "link"
 
 # ============================================================
 # 2. MAPPING CON ANALYZER PERSONALIZZATI
@@ -411,52 +470,299 @@ MAPPING = {
             "paragraphs": {"type": "text", "analyzer": "english_custom"},
             "content_full": {"type": "text", "analyzer": "english_custom"},
             "source": {"type": "keyword"},
-            "file_path": {"type": "keyword"}
+            "file_path": {"type": "keyword"},
+            "duplicate_of": {"type": "keyword"}
+        }
+    }
+}
+
+# Indice delle tabelle: un documento per ogni tabella estratta da extract_tables
+TABLES_MAPPING = {
+    "settings": MAPPING["settings"],
+    "mappings": {
+        "properties": {
+            "paper_id": {"type": "keyword"},
+            "table_id": {"type": "keyword"},
+            "caption": {"type": "text", "analyzer": "english_custom"},
+            "body": {"type": "text", "analyzer": "english_custom"},
+            "mentions": {"type": "text", "analyzer": "english_custom"},
+            "context_paragraphs": {"type": "text", "analyzer": "english_custom"},
+            "source": {"type": "keyword"},
+            "file_path": {"type": "keyword"},
+            "duplicate_of": {"type": "keyword"},
+            "n_rows": {"type": "integer"},
+            "n_cols": {"type": "integer"},
+            "header_rows": {"type": "integer"},
+            "header_column": {"type": "boolean"},
+            # Una voce per colonna: nested, così nome e valori di una colonna
+            # restano legati (es. name:"HR" AND numbers > 1.5 sulla STESSA colonna)
+            "columns": {
+                "type": "nested",
+                "properties": {
+                    "name": {
+                        "type": "text",
+                        "analyzer": "english_custom",
+                        "fields": {"raw": {"type": "keyword", "ignore_above": 256}}
+                    },
+                    # celle testuali: solo in _source, non servono per la ricerca
+                    "values": {"type": "keyword", "index": False, "doc_values": False},
+                    "numeric": {"type": "boolean"},
+                    "numbers": {"type": "double"}
+                }
+            }
         }
     }
 }
 
 # ============================================================
-# 3. CREA INDICE (CON ELIMINAZIONE PRECEDENTE)
+# 3. INDICI VERSIONATI DIETRO ALIAS (REINDEX SENZA DOWNTIME)
 # ============================================================
 
-def create_index(overwrite=False):
+def articles_mapping(profile=None):
+    """Mapping dell'indice articoli per il profilo di memorizzazione richiesto."""
+    profile = profile or STORAGE_PROFILE
+    if profile == "completo":
+        return MAPPING
+    if profile == "compatto":
+        mappings = dict(MAPPING["mappings"], _source={"excludes": ["content_full"]})
+        return dict(MAPPING, mappings=mappings)
+    raise ValueError("STORAGE_PROFILE must be 'completo' or 'compatto'")
+
+
+def index_configs():
+    """Coppie (alias, mapping dell'indice fisico) da creare/ricostruire."""
+    return [(INDEX_NAME, articles_mapping()), (TABLES_INDEX_NAME, TABLES_MAPPING)]
+
+
+def versioned_name(alias, stamp=None):
+    """Nome dell'indice fisico: alias + timestamp."""
+    stamp = stamp or datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    return f"{alias}-{stamp}"
+
+
+def alias_targets(alias):
+    """Indici fisici a cui punta l'alias (lista vuota se l'alias non esiste)."""
+    if not ES.indices.exists_alias(name=alias):
+        return []
+    return sorted(ES.indices.get_alias(name=alias).keys())
+
+
+def indices_exist():
+    """True se entrambi gli alias (o gli indici legacy con lo stesso nome) esistono."""
+    return all(ES.indices.exists(index=alias) for alias, _ in index_configs())
+
+
+def create_index():
     """
-    Crea l'indice. Se overwrite è True, elimina l'indice se esiste già.
+    Crea gli indici che mancano, già dietro il loro alias.
+    Ritorna True se almeno uno è stato creato (quindi è vuoto).
     """
-    if ES.indices.exists(index=INDEX_NAME):
-        if overwrite:
+    created = False
+    for alias, mapping in index_configs():
+        if ES.indices.exists(index=alias):
+            print(f"Indice '{alias}' già esistente. Saltando la creazione.")
+            continue
+        try:
+            name = versioned_name(alias)
+            ES.indices.create(index=name, body=dict(mapping, aliases={alias: {}}))
+            print(f"Indice '{name}' creato (alias '{alias}').")
+            created = True
+        except Exception as e:
+            print(f"ERRORE: Impossibile creare l'indice: {e}")
+    return created
+
+
+def _create_for_bulk_load(name, mapping):
+    """Nuovo indice fisico ottimizzato per il caricamento: niente refresh, zero repliche."""
+    body = dict(mapping)
+    body["settings"] = dict(mapping["settings"], index={"refresh_interval": "-1", "number_of_replicas": 0})
+    ES.indices.create(index=name, body=body)
+    print(f"Indice '{name}' creato per il caricamento.")
+
+
+def _finalize_index(name):
+    """Dopo il caricamento: force-merge e ripristino di refresh e repliche."""
+    ES.options(request_timeout=FORCEMERGE_TIMEOUT).indices.forcemerge(index=name, max_num_segments=1)
+    ES.indices.put_settings(index=name, settings={
+        "index": {"refresh_interval": None, "number_of_replicas": INDEX_REPLICAS}
+    })
+    ES.indices.refresh(index=name)
+    print(f"Indice '{name}' ottimizzato (force-merge) e pronto.")
+
+
+def swap_aliases(new_indices):
+    """
+    Sposta atomicamente ogni alias sul nuovo indice fisico con una sola
+    chiamata _aliases; solo se lo swap riesce vengono eliminati i vecchi indici.
+    Un vecchio indice "legacy" con lo stesso nome dell'alias viene rimosso
+    nella stessa azione atomica (remove_index).
+    """
+    actions, old_indices = [], []
+    for alias, name in new_indices.items():
+        targets = alias_targets(alias)
+        if targets:
+            actions.extend({"remove": {"index": old, "alias": alias}} for old in targets)
+            old_indices.extend(targets)
+        elif ES.indices.exists(index=alias):
+            actions.append({"remove_index": {"index": alias}})
+        actions.append({"add": {"index": name, "alias": alias}})
+
+    ES.indices.update_aliases(actions=actions)
+    print("Alias aggiornati: " + ", ".join(f"{a} -> {n}" for a, n in new_indices.items()))
+
+    for old in old_indices:
+        try:
+            ES.indices.delete(index=old)
+            print(f"Vecchio indice '{old}' eliminato.")
+        except Exception as e:
+            print(f"[ATTENZIONE] Impossibile eliminare il vecchio indice '{old}': {e}")
+
+
+def rebuild_indices(directories, **index_kwargs):
+    """
+    Ricostruzione completa senza downtime: le cartelle [(path, source), ...]
+    vengono caricate in nuovi indici versionati mentre gli alias continuano a
+    servire i vecchi; poi force-merge, impostazioni normali e swap atomico.
+    Il manifest viene sostituito solo se lo swap riesce; se i documenti
+    falliti superano REBUILD_MAX_FAILURES lo swap non avviene.
+    Ritorna True se la ricostruzione è andata a buon fine.
+    """
+    stamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    new_indices = {alias: versioned_name(alias, stamp) for alias, _ in index_configs()}
+    manifest = {"index": INDEX_NAME, "files": {}}
+    manifest_tmp = MANIFEST_PATH + ".rebuild"
+
+    try:
+        for alias, mapping in index_configs():
+            _create_for_bulk_load(new_indices[alias], mapping)
+        failures = 0
+        for path, source in directories:
+            stats = index_directory(path, source, manifest=manifest, manifest_path=manifest_tmp,
+                                    indices=(new_indices[INDEX_NAME], new_indices[TABLES_INDEX_NAME]),
+                                    **index_kwargs)
+            failures += stats["falliti"] + stats["errori"]
+        if failures > REBUILD_MAX_FAILURES:
+            raise RuntimeError(f"{failures} documenti falliti o con errori "
+                               f"(massimo {REBUILD_MAX_FAILURES}), indici incompleti")
+        for name in new_indices.values():
+            _finalize_index(name)
+        swap_aliases(new_indices)
+    except Exception as e:
+        print(f"ERRORE: ricostruzione fallita, gli alias puntano ancora ai vecchi indici: {e}")
+        if os.path.exists(manifest_tmp):
+            os.remove(manifest_tmp)
+        # spesso si arriva qui perché ES non risponde: la pulizia non deve
+        # nascondere l'errore originale
+        for name in new_indices.values():
             try:
-                # 🔄 MODIFICA CHIAVE: Elimina l'indice esistente
-                ES.indices.delete(index=INDEX_NAME, ignore=[400, 404])
-                print(f"Indice '{INDEX_NAME}' eliminato con successo.")
-            except Exception as e:
-                print(f"ERRORE: Impossibile eliminare l'indice: {e}")
-        else:
-            print(f"Indice '{INDEX_NAME}' già esistente. Saltando la creazione.")
-            return
+                ES.indices.delete(index=name, ignore_unavailable=True)
+            except Exception as delete_error:
+                print(f"[ATTENZIONE] Impossibile eliminare il nuovo indice '{name}': {delete_error}")
+        return False
+
+    os.replace(manifest_tmp, MANIFEST_PATH)
+    return True
+
+
+# ------------------------------------------------------------
+# Migrazione del profilo di memorizzazione (completo <-> compatto)
+# ------------------------------------------------------------
+
+def _index_storage_stats(name):
+    """Dimensione su disco (primarie), numero di documenti e costo di indicizzazione."""
+    primaries = ES.indices.stats(index=name, metric=["store", "docs", "indexing"])["indices"][name]["primaries"]
+    indexed = primaries["indexing"]["index_total"]
+    index_ms = primaries["indexing"]["index_time_in_millis"]
+    return {
+        "index": name,
+        "docs": primaries["docs"]["count"],
+        "store_bytes": primaries["store"]["size_in_bytes"],
+        "index_ms_per_doc": round(index_ms / indexed, 4) if indexed else None,
+    }
+
+
+def _excludes_content_full(alias):
+    """True se l'indice dietro l'alias non salva content_full in _source."""
+    for mapping in ES.indices.get_mapping(index=alias).values():
+        excludes = mapping["mappings"].get("_source", {}).get("excludes", [])
+        if "content_full" in excludes:
+            return True
+    return False
+
+
+def migrate_storage_profile(profile):
+    """
+    Porta l'indice articoli al profilo 'profile' senza ri-parsare l'HTML:
+    _reindex dal vecchio indice a uno nuovo versionato, force-merge, swap
+    dell'alias e report (JSON in REPORT_DIR) su dimensione e throughput
+    prima/dopo. Da "compatto" a "completo" serve invece rebuild_indices,
+    perché content_full non è più presente in _source.
+    """
+    mapping = articles_mapping(profile)
+    old = alias_targets(INDEX_NAME) or [INDEX_NAME]
+    if profile == "completo" and _excludes_content_full(INDEX_NAME):
+        print("ERRORE: content_full non è in _source, impossibile ricostruirlo con _reindex: "
+              "usa rebuild_indices con STORAGE_PROFILE = 'completo'.")
+        return None
 
+    new = versioned_name(INDEX_NAME)
+    _create_for_bulk_load(new, mapping)
     try:
-        ES.indices.create(index=INDEX_NAME, body=MAPPING)
-        print(f"Indice '{INDEX_NAME}' creato.")
+        start = time.perf_counter()
+        resp = ES.options(request_timeout=3600).reindex(
+            source={"index": INDEX_NAME}, dest={"index": new}, wait_for_completion=True
+        )
+        elapsed = time.perf_counter() - start
+        if resp.get("failures"):
+            raise RuntimeError(f"{len(resp['failures'])} documenti non copiati: {resp['failures'][:3]}")
+        _finalize_index(new)
+        before = [_index_storage_stats(name) for name in old]
+        swap_aliases({INDEX_NAME: new})
     except Exception as e:
-        print(f"ERRORE: Impossibile creare l'indice: {e}")
+        print(f"ERRORE: migrazione fallita, l'alias punta ancora al vecchio indice: {e}")
+        ES.indices.delete(index=new, ignore_unavailable=True)
+        return None
+
+    after = _index_storage_stats(new)
+    before_bytes = sum(s["store_bytes"] for s in before)
+    report = {
+        "profile": profile,
+        "before": before,
+        "after": after,
+        "size_reduction_pct": round(100 * (1 - after["store_bytes"] / before_bytes), 1) if before_bytes else None,
+        "reindex_docs_per_s": round(resp.get("total", 0) / max(elapsed, 1e-9), 1),
+    }
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_path = os.path.join(REPORT_DIR, f"storage_{profile}_{stamp}.json")
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Dimensione indice articoli: {before_bytes / 1024 ** 2:.1f} MB -> "
+          f"{after['store_bytes'] / 1024 ** 2:.1f} MB ({report['size_reduction_pct']}% in meno)")
+    print(f"Costo di indicizzazione: {[s['index_ms_per_doc'] for s in before]} -> "
+          f"{after['index_ms_per_doc']} ms/doc; reindex a {report['reindex_docs_per_s']} doc/s")
+    print(f"Report: {report_path}")
+    return report
 
 # ============================================================
 # 4. ESTRAZIONE METADATI E PARAGRAFI DA HTML
 # ============================================================
 
-def parse_html(filepath: str):
-    """Estrae i metadati e il testo completo (suddiviso in paragrafi) dal file HTML."""
-    try:
-        with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-            html = f.read()
-    except Exception as e:
-        print(f"Errore nella lettura del file {filepath}: {e}")
-        return None
+def parse_html(filepath: str, document=None, parser: str = None):
+    """
+    Estrae i metadati e il testo completo (suddiviso in paragrafi) dal file HTML.
+    Se 'document' (ParsedDocument) è già disponibile, riusa il suo albero
+    invece di rileggere e ri-parsare il file; altrimenti il file viene
+    parsato con il backend 'parser' (default PARSER_BACKEND).
+    """
+    if document is None:
+        document = load_document(filepath, parser=parser or PARSER_BACKEND)
+        if document is None:
+            return None
 
-    # Utilizziamo 'html.parser' che gestisce bene i tag mal formattati
-    soup = BeautifulSoup(html, "html.parser")
+    soup = document.soup
+    t = instrumentation.checkpoint()
 
     title, abstract, date = "", "", None
     authors = []
@@ -505,6 +811,8 @@ def parse_html(filepath: str):
         if date_tag:
             date = date_tag.get_text(strip=True)
 
+    t = instrumentation.record("parse_html.metadati", t)
+
     # -----------------------------------------------------------------
     # C. EURISTICA DEL CORPO (Pulizia e Gestione Data)
     # -----------------------------------------------------------------
@@ -596,6 +904,8 @@ def parse_html(filepath: str):
     authors = [a for a in authors if len(a) > 2 or (len(a.split()) > 1)]
     authors_str = ", ".join(authors)
 
+    t = instrumentation.record("parse_html.euristiche", t)
+
     # -----------------------------------------------------------------
     # D. ESTRAZIONE TESTO COMPLETO E PARAGRAFI (Pulizia Paragrafi)
     # -----------------------------------------------------------------
@@ -628,9 +938,11 @@ def parse_html(filepath: str):
             paragraphs_list.append(paragraph_text)
 
     paragraphs_content = " ".join(paragraphs_list)
+    t = instrumentation.record("parse_html.paragrafi", t)
 
     # 📝 Aggiornamento di content_full: si basa sull'intera pagina o sull'area principale
     content_full = soup.get_text(" ", strip=True)
+    instrumentation.record("parse_html.content_full", t)
 
     if not paragraphs_content and content_full:
         paragraphs_content = content_full # Fallback per i documenti senza <p>
@@ -649,10 +961,15 @@ def parse_html(filepath: str):
 # 5. INDICIZZAZIONE DOCUMENTI
 # ============================================================
 
+def document_id(file_path: str) -> str:
+    """ID del documento: hash del percorso del file."""
+    return hashlib.md5(file_path.encode()).hexdigest()
+
+
 def index_document(doc):
     """Indicizza il singolo documento in Elasticsearch."""
     # Genera un ID basato sull'hash del percorso del file
-    doc_id = hashlib.md5(doc["file_path"].encode()).hexdigest()
+    doc_id = document_id(doc["file_path"])
     try:
         # Utilizzo del parametro 'document' introdotto nelle versioni recenti della libreria
         ES.index(index=INDEX_NAME, id=doc_id, document=doc)
@@ -660,6 +977,116 @@ def index_document(doc):
         print(f"[ERRORE] Indicizzazione file {doc['file_path']} fallita: {e}")
 
 
+def build_action(doc, index_name=INDEX_NAME):
+    """Costruisce l'azione bulk (index) per un documento già parsato."""
+    return {
+        "_op_type": "index",
+        "_index": index_name,
+        "_id": document_id(doc["file_path"]),
+        "_source": doc,
+    }
+
+
+def table_id(file_path: str, position: int) -> str:
+    """ID di una tabella: ID del documento + posizione della tabella nella pagina."""
+    return f"{document_id(file_path)}-t{position}"
+
+
+def build_table_action(table, file_path, source, position, index_name=TABLES_INDEX_NAME):
+    """Costruisce l'azione bulk (index) per una tabella estratta da extract_tables."""
+    body = dict(table, file_path=file_path, source=source)
+    return {
+        "_op_type": "index",
+        "_index": index_name,
+        "_id": table_id(file_path, position),
+        "_source": body,
+    }
+
+
+# ------------------------------------------------------------
+# Manifest per l'indicizzazione incrementale:
+# file_path -> hash del contenuto, mtime, size, ID del documento in ES
+# ------------------------------------------------------------
+
+def file_sha1(file_path: str) -> str:
+    """Hash SHA-1 del contenuto del file (letto a blocchi)."""
+    h = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    """Carica il manifest; se manca, è corrotto o riferito ad un altro indice ne crea uno vuoto."""
+    empty = {"index": INDEX_NAME, "files": {}}
+    if not os.path.exists(manifest_path):
+        return empty
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[ATTENZIONE] Manifest illeggibile ({e}): verrà ricostruito.")
+        return empty
+    if manifest.get("index") != INDEX_NAME or not isinstance(manifest.get("files"), dict):
+        return empty
+    return manifest
+
+
+def save_manifest(manifest, manifest_path=MANIFEST_PATH):
+    """Salva il manifest in modo atomico (file temporaneo + rename)."""
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def manifest_entry(file):
+    """Voce del manifest per il contenuto attuale di un file (tabelle ancora da contare)."""
+    st = os.stat(file)
+    return {"sha1": file_sha1(file), "mtime": st.st_mtime, "size": st.st_size,
+            "doc_id": document_id(file), "tables": 0}
+
+
+def plan_incremental(html_files, path, manifest):
+    """
+    Confronta i file presenti su disco con il manifest.
+    Ritorna (da_indicizzare, eliminati, invariati, nuove_voci):
+    - un file con mtime e size invariati non viene nemmeno letto;
+    - se cambiano mtime/size si ricalcola l'hash, e solo un contenuto
+      diverso porta a ri-parsare il file;
+    - i file spariti dalla cartella vanno rimossi da Elasticsearch.
+    """
+    files_entries = manifest["files"]
+    to_index, unchanged, new_entries = [], 0, {}
+
+    for file in html_files:
+        st = os.stat(file)
+        entry = files_entries.get(file)
+        if entry and entry["mtime"] == st.st_mtime and entry["size"] == st.st_size:
+            unchanged += 1
+            continue
+
+        new_entry = manifest_entry(file)
+        if entry and entry["sha1"] == new_entry["sha1"]:
+            # Solo "touch": il contenuto è lo stesso, aggiorno mtime e basta
+            files_entries[file] = dict(entry, mtime=st.st_mtime, size=st.st_size)
+            unchanged += 1
+            continue
+
+        to_index.append(file)
+        new_entries[file] = new_entry
+
+    present = set(html_files)
+    folder = os.path.normpath(path)
+    deleted = sorted(
+        f for f in files_entries
+        if os.path.normpath(os.path.dirname(f)) == folder and f not in present
+    )
+    return to_index, deleted, unchanged, new_entries
+
+
 
 #QUESTO NON ESTRAE LE TABELLE 
 '''
@@ -688,47 +1115,551 @@ def index_directory(path, source):
 
     print(f"Indicizzazione completata per {path}. Documenti indicizzati: {indexed_count}")
 '''
-def process_file(filepath: str, source: str):
-    # 1) leggi HTML
-    html = Path(filepath).read_text(encoding="utf-8", errors="ignore")
+@lru_cache(maxsize=None)
+def parse_cache_version():
+    """Versione della cache: cambia quando cambia il codice di parsing/estrazione."""
+    return parse_cache.code_version(parse_html, extract_tables, html_document)
 
-    # 2) parsalo con la tua parse_html esistente
-    doc = parse_html(filepath)
+
+def _extract(document, filepath, paper_id):
+    """parse_html + extract_tables sullo stesso albero già costruito."""
+    # metadati e paragrafi dallo stesso albero
+    doc = parse_html(filepath, document=document)
     if not doc:
-        return
+        return None, []
+    # tabelle riusando l'albero già costruito
+    return doc, extract_tables_from_html(document, paper_id=paper_id)
+
 
-    # 3) paper_id: per ora puoi usare l'hash o il nome file
+def _process_cached(filepath, paper_id, parser):
+    """
+    Come _extract, ma passando dalla cache su disco: se il contenuto del file
+    è già stato parsato (con lo stesso backend e la stessa versione del codice)
+    il risultato viene riletto invece di ricostruire l'albero HTML.
+    """
+    try:
+        with instrumentation.stage("io"):
+            raw = Path(filepath).read_bytes()
+    except Exception as e:
+        print(f"Errore nella lettura del file {filepath}: {e}")
+        return None, []
+
+    key = parse_cache.cache_key(raw, parser)
+    t = instrumentation.checkpoint()
+    cached = parse_cache.get(PARSE_CACHE_DIR, parse_cache_version(), key)
+    if cached is not None:
+        instrumentation.record("cache.hit", t)
+        doc, tables = cached["doc"], cached["tables"]
+        # La voce è indicizzata per contenuto: i campi legati al percorso vanno riscritti
+        doc["file_path"] = filepath
+        for table in tables:
+            table["paper_id"] = paper_id
+        return doc, tables
+    instrumentation.record("cache.miss", t)
+
+    doc, tables = _extract(ParsedDocument(decode_html(raw), filepath, parser=parser), filepath, paper_id)
+    if doc:
+        with instrumentation.stage("cache.scrittura"):
+            parse_cache.put(PARSE_CACHE_DIR, parse_cache_version(), key, {"doc": doc, "tables": tables})
+    return doc, tables
+
+
+def process_file(filepath: str, source: str, parser: str = None, use_cache: bool = None):
+    """
+    Parsa un file HTML e ritorna (documento, tabelle) pronti per
+    l'indicizzazione ((None, []) se il parsing fallisce). L'invio a
+    Elasticsearch avviene in bulk in index_directory.
+    Con la cache attiva (USE_PARSE_CACHE) un file già visto non viene ri-parsato.
+    """
+    parser = parser or PARSER_BACKEND
+    use_cache = USE_PARSE_CACHE if use_cache is None else use_cache
+
+    # paper_id: per ora puoi usare l'hash o il nome file
     paper_id = Path(filepath).stem
 
-    # 4) estrai tabelle
-    tables = extract_tables_from_html(html, paper_id=paper_id)
+    if use_cache:
+        doc, tables = _process_cached(filepath, paper_id, parser)
+    else:
+        # leggi e parsa l'HTML una sola volta
+        document = load_document(filepath, parser=parser)
+        if document is None:
+            return None, []
+        doc, tables = _extract(document, filepath, paper_id)
 
-    # 5) indicizza il documento principale (già lo fai)
+    if not doc:
+        return None, []
+
+    # documento e tabelle vengono inviati in bulk dal chiamante,
+    # le tabelle nell'indice dedicato TABLES_INDEX_NAME
     doc["source"] = source
-    index_document(doc)
 
-    # 6) (opzionale) indicizza le tabelle in un indice "tables"
-    # for t in tables:
-    #     index_table_in_es(t)
+    if NEAR_DUP_POLICY:
+        # firme calcolate nel worker; _generate_actions le toglie prima dell'invio a ES
+        with instrumentation.stage("minhash"):
+            doc["minhash"] = near_duplicates.to_hex(near_duplicates.signature(document_text(doc)))
+            for table in tables:
+                table["minhash"] = near_duplicates.to_hex(near_duplicates.signature(table_text(table)))
 
-def index_directory(path, source):
-    """Processa e indicizza tutti i file HTML in una directory, incluse le tabelle."""
-    
-    html_files = glob.glob(os.path.join(path, "*.html"))
-    print(f"\nIndicizzazione cartella: {path}")
-    print(f"File trovati: {len(html_files)}\n")
+    return doc, tables
 
-    indexed_count = 0
 
+def document_text(doc):
+    """Testo su cui si confrontano i documenti per i quasi-duplicati."""
+    return "\n".join(filter(None, (doc.get("title"), doc.get("abstract"), doc.get("paragraphs"))))
+
+
+def table_text(table):
+    """Testo su cui si confrontano le tabelle per i quasi-duplicati."""
+    return "\n".join(filter(None, (table.get("caption"), table.get("body"))))
+
+
+# Versione arXiv nel nome del file (2301.06264v2.html): tra più versioni
+# dello stesso paper l'originale è la più recente
+ARXIV_VERSION_RE = re.compile(r"^(.+?)v(\d+)$")
+
+
+def canonical_order(file):
+    """
+    Chiave di ordinamento per l'indicizzazione con i quasi-duplicati: le
+    versioni dello stesso paper sono vicine e la più recente viene prima,
+    così diventa lei l'originale e le altre si collegano a lei.
+    """
+    stem = Path(file).stem
+    match = ARXIV_VERSION_RE.match(stem)
+    base, version = (match.group(1), int(match.group(2))) if match else (stem, 0)
+    return os.path.dirname(file), base, -version, file
+
+
+def requeue_duplicates(html_files, deleted, path, manifest, new_entries):
+    """
+    File invariati da ri-processare perché il loro originale cambia: i
+    duplicati (documento o tabelle) di un file eliminato o modificato, e le
+    versioni più vecchie di un paper di cui arriva una versione nuova (che
+    diventa l'originale). Segue le catene finché l'insieme non cambia più:
+    un file ri-processato può a sua volta smettere di essere un originale.
+    Aggiunge le voci in new_entries e ritorna (file da indicizzare, quanti in più).
+    """
+    files = manifest["files"]
+    folder = os.path.normpath(path)
+    deleted = set(deleted)
+    candidates = {f: entry for f, entry in files.items()
+                  if os.path.normpath(os.path.dirname(f)) == folder
+                  and f not in new_entries and f not in deleted and os.path.exists(f)}
+
+    newest = {}     # id del paper -> versione più recente in arrivo (negata, come in canonical_order)
     for file in html_files:
+        _, base, version, _ = canonical_order(file)
+        newest[base] = min(newest.get(base, version), version)
+    requeued = set()
+    for file, entry in candidates.items():
+        _, base, version, _ = canonical_order(file)
+        if not entry.get("duplicate_of") and base in newest and version > newest[base]:
+            requeued.add(file)
+
+    changed = set(html_files) | deleted | requeued
+    while True:
+        more = {f for f, entry in candidates.items()
+                if f not in requeued
+                and ({entry.get("duplicate_of"), *(entry.get("tables_duplicate_of") or ())} & changed)}
+        if not more:
+            break
+        requeued |= more
+        changed |= more
+
+    for file in requeued:
+        new_entries[file] = manifest_entry(file)
+    return list(html_files) + sorted(requeued), len(requeued)
+
+
+def build_duplicate_indexes(manifest, exclude=()):
+    """
+    Indici LSH (documenti, tabelle) con le firme degli originali già nel
+    manifest, esclusi i file in 'exclude' (da re-indicizzare o eliminati).
+    I duplicati non vengono aggiunti: un'altra copia si collega all'originale.
+    """
+    docs, tables = near_duplicates.LSHIndex(), near_duplicates.LSHIndex()
+    if manifest is None:
+        return docs, tables
+    for file, entry in manifest["files"].items():
+        if file in exclude:
+            continue
+        if not entry.get("duplicate_of"):
+            docs.add(file, near_duplicates.from_hex(entry.get("minhash")))
+        for position, value in enumerate(entry.get("tables_minhash") or ()):
+            tables.add((file, position), near_duplicates.from_hex(value))
+    return docs, tables
+
+
+def _parse_task(file, source, parser=None):
+    """
+    Unità di lavoro dei worker: un errore resta confinato al singolo file
+    e viene restituito al processo principale invece di propagarsi.
+    Restituisce anche i tempi per stadio misurati sul file.
+    """
+    instrumentation.drain()
+    try:
+        with instrumentation.stage("file.totale"):
+            doc, tables = process_file(file, source, parser=parser)
+        return file, doc, tables, None, instrumentation.drain()
+    except Exception as e:
+        return file, None, [], f"{type(e).__name__}: {e}", instrumentation.drain()
+
+
+def iter_parsed_files(html_files, source, workers=PARSE_WORKERS, queue_size=PARSE_QUEUE_SIZE,
+                      parser=None):
+    """
+    Parsa i file (in parallelo se workers > 1) e restituisce le tuple
+    (file, doc, tabelle, errore, tempi) nello STESSO ordine di html_files, qualunque sia il
+    numero di worker. Al massimo 'queue_size' file sono in lavorazione o in
+    attesa di essere consumati, così la memoria resta costante.
+
+    Se un worker muore (OOM, crash di lxml) il pool si rompe e tutti i file in
+    volo falliscono insieme: vengono riparsati uno alla volta in un processo
+    dedicato (solo il file responsabile risulta in errore) e il pool viene ricreato.
+    """
+    if workers <= 1:
+        for file in html_files:
+            yield _parse_task(file, source, parser)
+        return
+
+    pool = ProcessPoolExecutor(max_workers=workers)
+
+    def submit(file):
+        nonlocal pool
         try:
-            process_file(file, source)   # 👈 ORA richiama la funzione completa
-            indexed_count += 1
-            print(f"[OK] Processato: {file}")
-        except Exception as e:
-            print(f"[ERRORE] Impossibile processare {file}: {e}")
+            return pool.submit(_parse_task, file, source, parser)
+        except BrokenProcessPool:
+            pool.shutdown()
+            pool = ProcessPoolExecutor(max_workers=workers)
+            return pool.submit(_parse_task, file, source, parser)
+
+    files = iter(html_files)
+    try:
+        window = deque()
+        for file in files:
+            window.append((file, submit(file)))
+            if len(window) >= queue_size:
+                break
+
+        while window:
+            file, future = window.popleft()
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                result = _parse_isolated(file, source, parser)
+            except Exception as e:
+                result = (file, None, [], f"{type(e).__name__}: {e}", {})
+
+            # Rimpiazza lo slot liberato prima di passare il risultato a valle
+            nxt = next(files, None)
+            if nxt is not None:
+                window.append((nxt, submit(nxt)))
+            yield result
+    finally:
+        pool.shutdown()
+
+
+def _parse_isolated(file, source, parser):
+    """Parsa un file in un processo tutto suo: se il processo muore, l'errore resta su questo file."""
+    try:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            return pool.submit(_parse_task, file, source, parser).result()
+    except Exception as e:  # es. worker terminato in modo anomalo
+        return (file, None, [], f"{type(e).__name__}: {e}", {})
+
+
+def _delete_tables_actions(file, start, stop, pending, index_name=TABLES_INDEX_NAME):
+    """Cancellazioni delle tabelle in posizione [start, stop) di un file."""
+    for position in range(start, stop):
+        tid = table_id(file, position)
+        pending[tid] = (file, "tabella")
+        yield {"_op_type": "delete", "_index": index_name, "_id": tid}
 
-    print(f"Indicizzazione completata per {path}. Documenti indicizzati: {indexed_count}")
+
+def _generate_actions(html_files, source, stats, pending, workers=PARSE_WORKERS, deleted=(),
+                      old_entries=None, new_entries=None, parser=None, report=None,
+                      indices=(INDEX_NAME, TABLES_INDEX_NAME), dedup=None, parsed=None):
+    """
+    Generatore di azioni bulk: prima le cancellazioni dei file spariti, poi
+    i documenti (e le loro tabelle) che arrivano dal parsing, seriale o
+    parallelo, tenuti in memoria solo fino all'invio del loro chunk.
+    old_entries/new_entries (manifest) servono a rimuovere le tabelle in
+    eccesso quando una pagina modificata ne contiene meno di prima.
+    I tempi per stadio di ogni file finiscono in 'report' (StageReport).
+    'indices' = (indice articoli, indice tabelle) di destinazione.
+    'dedup' = (LSH documenti, LSH tabelle) per applicare NEAR_DUP_POLICY.
+    'parsed' = risultati di _parse_task già pronti (es. da pipeline.py) al
+    posto del parsing di html_files.
+    """
+    articles_index, tables_index = indices
+    old_entries = old_entries or {}
+    new_entries = new_entries if new_entries is not None else {}
+
+    for file in deleted:
+        # Letto prima dello yield: l'esito della delete rimuove la voce dal manifest
+        old_count = old_entries.get(file, {}).get("tables", 0)
+        doc_id = document_id(file)
+        pending[doc_id] = (file, "documento")
+        yield {"_op_type": "delete", "_index": articles_index, "_id": doc_id}
+        yield from _delete_tables_actions(file, 0, old_count, pending, tables_index)
+
+    if parsed is None:
+        parsed = iter_parsed_files(html_files, source, workers=workers, parser=parser)
+    for file, doc, tables, error, timings in parsed:
+        if report is not None:
+            report.add_file(file, timings)
+        if error:
+            stats["errori"] += 1
+            print(f"[ERRORE] Impossibile processare {file}: {error}")
+            continue
+
+        if not doc:
+            stats["saltati"] += 1
+            print(f"[SKIP] Impossibile parsare: {file}")
+            continue
+
+        stats["bytes"] += os.path.getsize(file)
+        old_count = old_entries.get(file, {}).get("tables", 0)
+        doc_hash = doc.pop("minhash", None)
+        original = _find_duplicate(dedup, 0, file, doc_hash)
+        if original:
+            stats["duplicati"] += 1
+            print(f"[DUP] {file} è un quasi-duplicato di {original}")
+        if original and NEAR_DUP_POLICY == "collapse":
+            # niente documento nell'indice; la delete toglie una sua eventuale versione precedente
+            doc_id = document_id(file)
+            pending[doc_id] = (file, "duplicato")
+            yield {"_op_type": "delete", "_index": articles_index, "_id": doc_id}
+        else:
+            if original:
+                doc["duplicate_of"] = document_id(original)
+            action = build_action(doc, articles_index)
+            pending[action["_id"]] = (file, "documento")
+            yield action
+
+        tables_hashes, tables_originals = [], []
+        for position, table in enumerate(tables):
+            table_hash = table.pop("minhash", None)
+            table_original = _find_duplicate(dedup, 1, (file, position), table_hash)
+            # nel manifest restano solo le firme degli originali
+            tables_hashes.append(None if table_original else table_hash)
+            tables_originals.append(table_original[0] if table_original else None)
+            if table_original:
+                stats["tabelle_duplicate"] += 1
+                if NEAR_DUP_POLICY == "collapse":
+                    tid = table_id(file, position)
+                    pending[tid] = (file, "tabella")
+                    yield {"_op_type": "delete", "_index": tables_index, "_id": tid}
+                    continue
+                table["duplicate_of"] = table_id(*table_original)
+            table_action = build_table_action(table, file, source, position, tables_index)
+            pending[table_action["_id"]] = (file, "tabella")
+            yield table_action
+
+        if file in new_entries:
+            new_entries[file]["tables"] = len(tables)
+            if dedup is not None:
+                new_entries[file]["minhash"] = doc_hash
+                new_entries[file]["duplicate_of"] = original
+                new_entries[file]["tables_minhash"] = tables_hashes
+                new_entries[file]["tables_duplicate_of"] = tables_originals
+        yield from _delete_tables_actions(file, len(tables), old_count, pending, tables_index)
+
+
+def _find_duplicate(dedup, which, key, sig_hex):
+    """
+    Cerca 'key' nell'indice LSH dedup[which] (0 = documenti, 1 = tabelle):
+    ritorna la chiave dell'originale se è un quasi-duplicato, altrimenti
+    registra la firma (diventa un originale) e ritorna None.
+    """
+    if dedup is None or not sig_hex:
+        return None
+    lsh = dedup[which]
+    sig = near_duplicates.from_hex(sig_hex)
+    match = lsh.query(sig)
+    if match and match[0] != key:
+        return match[0]
+    lsh.add(key, sig)
+    return None
+
+
+def _timed_bulk_results(results, producer, report):
+    """
+    Passa i risultati di streaming_bulk misurando il tempo delle richieste bulk:
+    quando un next() ha dovuto raccogliere nuove azioni, è stato inviato un
+    chunk, e il suo costo è il tempo totale meno quello speso dal generatore.
+    """
+    while True:
+        calls, busy = producer.calls, producer.busy
+        start = time.perf_counter()
+        try:
+            result = next(results)
+        except StopIteration:
+            return
+        if producer.calls != calls:
+            report.add("es.bulk", time.perf_counter() - start - (producer.busy - busy))
+        yield result
+
+
+def _handle_bulk_result(ok, item, pending, stats, manifest=None, new_entries=None):
+    """
+    Esito di una azione bulk: aggiorna le statistiche e, se l'operazione è
+    confermata da ES, la voce del file nel manifest.
+    """
+    new_entries = new_entries or {}
+    op_type, info = next(iter(item.items()))
+    file, kind = pending.pop(info.get("_id"), (info.get("_id"), "documento"))
+
+    if kind == "duplicato":
+        # "collapse": il documento non è nell'indice, basta la conferma della delete
+        if ok or info.get("status") == 404:
+            if file in new_entries:
+                manifest["files"][file] = new_entries[file]
+        else:
+            stats["falliti"] += 1
+            print(f"[ERRORE] Rimozione del duplicato {file} fallita: {info.get('error')}")
+    elif kind == "tabella":
+        # 404 su una delete: la tabella non c'era già più
+        if ok or (op_type == "delete" and info.get("status") == 404):
+            stats["tabelle"] += op_type == "index"
+        else:
+            stats["falliti"] += 1
+            print(f"[ERRORE] Tabella {info.get('_id')} di {file} fallita: {info.get('error')}")
+    elif op_type == "delete":
+        # 404: il documento non era (più) nell'indice, va bene lo stesso
+        if ok or info.get("status") == 404:
+            stats["eliminati"] += 1
+            if manifest is not None:
+                manifest["files"].pop(file, None)
+            print(f"[DEL] Rimosso dall'indice: {file}")
+        else:
+            stats["falliti"] += 1
+            print(f"[ERRORE] Cancellazione {file} fallita: {info.get('error')}")
+    elif ok:
+        stats["indicizzati"] += 1
+        if file in new_entries:
+            manifest["files"][file] = new_entries[file]
+    else:
+        stats["falliti"] += 1
+        print(f"[ERRORE] Indicizzazione file {file} fallita: {info.get('error')}")
+
+
+def new_stats():
+    """Contatori di una run di indicizzazione."""
+    return {"indicizzati": 0, "tabelle": 0, "falliti": 0, "errori": 0, "saltati": 0, "bytes": 0,
+            "invariati": 0, "eliminati": 0, "duplicati": 0, "tabelle_duplicate": 0}
+
+
+def _write_report(path, source, stats, report, elapsed, workers, parser):
+    """Scrive il report JSON della run e, se richiesto, profila i file più lenti."""
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_path = os.path.join(REPORT_DIR, f"ingest_{source}_{stamp}.json")
+    report.write_json(report_path, path=path, source=source, workers=workers, parser=parser,
+                      elapsed_s=round(elapsed, 3), stats=stats)
+    report.print_summary()
+    print(f"Report dei tempi: {report_path}")
+
+    for _, file in report.slowest(PROFILE_SLOWEST_FILES):
+        prof_path = os.path.join(REPORT_DIR, f"profile_{source}_{stamp}_{Path(file).stem}.prof")
+        instrumentation.profile_call(prof_path, process_file, file, source, parser=parser)
+        print(f"Profilo cProfile: {prof_path}")
+
+
+def _print_summary(path, stats, elapsed):
+    """Riepilogo finale con il throughput dell'indicizzazione."""
+    elapsed = max(elapsed, 1e-9)
+    mb = stats["bytes"] / (1024 * 1024)
+    print(f"Indicizzazione completata per {path}. Documenti indicizzati: {stats['indicizzati']}, "
+          f"tabelle: {stats['tabelle']} (falliti: {stats['falliti']}, errori di parsing: {stats['errori']}, saltati: {stats['saltati']}, "
+          f"invariati: {stats['invariati']}, eliminati: {stats['eliminati']}, "
+          f"quasi-duplicati: {stats['duplicati']} documenti, {stats['tabelle_duplicate']} tabelle)")
+    print(f"Throughput: {stats['indicizzati'] / elapsed:.1f} doc/s, {mb / elapsed:.2f} MB/s "
+          f"({mb:.1f} MB di HTML in {elapsed:.1f}s)")
+
+
+def index_directory(path, source, chunk_docs=BULK_CHUNK_DOCS, chunk_bytes=BULK_CHUNK_BYTES,
+                    workers=PARSE_WORKERS, manifest=None, incremental=False, parser=PARSER_BACKEND,
+                    manifest_path=MANIFEST_PATH, indices=(INDEX_NAME, TABLES_INDEX_NAME)):
+    """
+    Processa tutti i file HTML in una directory e li invia a Elasticsearch
+    con streaming_bulk. Il parsing usa 'workers' processi; gli errori dei
+    singoli documenti vengono riportati senza far fallire il batch.
+
+    Se viene passato un manifest, ogni documento indicizzato (o cancellato)
+    con successo viene registrato. Con incremental=True vengono parsati solo
+    i file nuovi o modificati e si cancellano da ES quelli spariti.
+    'indices' = (articoli, tabelle): di default gli alias letti dai client,
+    durante una ricostruzione i nuovi indici fisici.
+    """
+    # Ordinati: l'ordine di indicizzazione non dipende dal filesystem
+    html_files = sorted(glob.glob(os.path.join(path, "*.html")))
+    print(f"\nIndicizzazione cartella: {path}")
+    print(f"File trovati: {len(html_files)} (worker di parsing: {workers}, parser: {parser})\n")
+
+    stats = new_stats()
+    pending = {}  # _id -> (file, tipo), per riportare gli errori sul file giusto
+    report = instrumentation.StageReport()
+    start = time.perf_counter()
+
+    if USE_PARSE_CACHE:
+        removed = parse_cache.invalidate_stale(PARSE_CACHE_DIR, parse_cache_version())
+        if removed:
+            print(f"Cache di parsing: eliminate {removed} versioni obsolete del codice di parsing.")
+
+    deleted, new_entries = [], {}
+    if manifest is not None:
+        if incremental:
+            html_files, deleted, stats["invariati"], new_entries = plan_incremental(html_files, path, manifest)
+            print(f"Modalità incrementale: {len(html_files)} nuovi/modificati, "
+                  f"{stats['invariati']} invariati, {len(deleted)} da eliminare\n")
+        else:
+            _, _, _, new_entries = plan_incremental(html_files, path, {"files": {}})
+
+    dedup = None
+    if NEAR_DUP_POLICY:
+        if manifest is not None and incremental:
+            html_files, requeued = requeue_duplicates(html_files, deleted, path, manifest, new_entries)
+            stats["invariati"] -= requeued
+            if requeued:
+                print(f"Quasi-duplicati: {requeued} file invariati da ri-processare perché "
+                      f"il loro originale è cambiato\n")
+        html_files = sorted(html_files, key=canonical_order)
+        dedup = build_duplicate_indexes(manifest, exclude=set(html_files) | set(deleted))
+        print(f"Quasi-duplicati ({NEAR_DUP_POLICY}): {len(dedup[0])} documenti e "
+              f"{len(dedup[1])} tabelle già noti\n")
+
+    producer = instrumentation.TimedIterator(
+        _generate_actions(html_files, source, stats, pending, workers=workers, deleted=deleted,
+                          old_entries=manifest["files"] if manifest is not None else None,
+                          new_entries=new_entries, parser=parser, report=report, indices=indices,
+                          dedup=dedup)
+    )
+    results = helpers.streaming_bulk(
+        ES,
+        producer,
+        chunk_size=chunk_docs,
+        max_chunk_bytes=chunk_bytes,
+        max_retries=BULK_MAX_RETRIES,
+        raise_on_error=False,
+        raise_on_exception=False,
+    )
+    try:
+        for ok, item in _timed_bulk_results(results, producer, report):
+            _handle_bulk_result(ok, item, pending, stats, manifest, new_entries)
+    finally:
+        # Anche se la run viene interrotta, il lavoro già confermato da ES resta nel manifest
+        if manifest is not None:
+            save_manifest(manifest, manifest_path)
+
+    elapsed = time.perf_counter() - start
+    _print_summary(path, stats, elapsed)
+    if USE_PARSE_CACHE:
+        hits, misses = report.count("cache.hit"), report.count("cache.miss")
+        evicted, size = parse_cache.enforce_size(PARSE_CACHE_DIR, PARSE_CACHE_MAX_BYTES)
+        print(f"Cache di parsing: {hits} hit, {misses} miss, {evicted} voci rimosse, "
+              f"{size / (1024 * 1024):.1f} MB occupati")
+    _write_report(path, source, stats, report, elapsed, workers, parser)
+    return stats
 
 
 # ============================================================
@@ -766,8 +1697,17 @@ def main():
     # MODIFICA QUESTO PERCORSO con il file problematico
     FILE_DA_DEBUGGARE = "html_corpus/arxiv_html/2301.06264v2.html"
 
-    # ⚙️ IMPOSTAZIONE CHIAVE: Forzare la ricreazione dell'indice ad ogni run
-    FORZA_RICREAZIONE_INDICE = True
+    # ⚙️ IMPOSTAZIONE CHIAVE: "completa" ricostruisce gli indici (nuova versione +
+    # swap dell'alias, senza downtime), "incrementale" indicizza solo i file
+    # nuovi/modificati e rimuove quelli spariti.
+    # Dopo una modifica dei mapping (es. le colonne strutturate delle tabelle)
+    # serve una ricostruzione "completa".
+    MODALITA_INDICIZZAZIONE = "incrementale"
+
+    CARTELLE = [("html_corpus/arxiv_html", "arxiv"), ("html_corpus/pmc_html", "pubmed")]
+
+    # Per passare un indice già esistente al profilo "compatto" senza ri-parsare:
+    # migrate_storage_profile("compatto") (e poi STORAGE_PROFILE = "compatto")
 
     # 1. ESEGUI TEST ISOLATO
     if os.path.exists(FILE_DA_DEBUGGARE):
@@ -778,11 +1718,14 @@ def main():
         print("ATTENZIONE: File di debug non trovato. Proseguo con l'indicizzazione completa.")
 
     # 2. PROSEGUI CON L'INDICIZZAZIONE
-    create_index(overwrite=FORZA_RICREAZIONE_INDICE)
-
-    # 3. INDICIZZA LE DIRECTORY
-    index_directory("html_corpus/arxiv_html", "arxiv")
-    index_directory("html_corpus/pmc_html", "pubmed")
+    # Senza indici esistenti la modalità incrementale non ha una base: si ricostruisce
+    if MODALITA_INDICIZZAZIONE == "incrementale" and indices_exist():
+        # 3. INDICIZZA LE DIRECTORY (scrivendo attraverso gli alias)
+        manifest = load_manifest()
+        for path, source in CARTELLE:
+            index_directory(path, source, manifest=manifest, incremental=True)
+    else:
+        rebuild_indices(CARTELLE)
 
     print("\n\n*** Indicizzazione Completata ***")
 
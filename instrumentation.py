@@ -0,0 +1,159 @@
+# instrumentation.py
+# Misura dei tempi per stadio della pipeline di ingestione
+# (lettura file, costruzione soup, euristiche di parse_html, tabelle, Elasticsearch).
+import cProfile
+import json
+import math
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Se False, stage/record non misurano nulla (overhead nullo)
+ENABLED = True
+
+# Campioni del processo corrente: vengono svuotati da drain() dopo ogni file,
+# così ogni worker restituisce al processo principale i tempi del singolo file.
+_samples = defaultdict(list)
+
+
+@contextmanager
+def stage(name):
+    """Misura il blocco 'with' come uno stadio della pipeline."""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _samples[name].append(time.perf_counter() - start)
+
+
+def checkpoint():
+    """Istante di partenza per record()."""
+    return time.perf_counter()
+
+
+def record(name, since):
+    """
+    Registra come stadio 'name' il tempo trascorso da 'since' e ritorna
+    l'istante attuale, da usare come partenza dello stadio successivo.
+    Comodo per funzioni lunghe divise in sezioni (es. parse_html).
+    """
+    now = time.perf_counter()
+    if ENABLED:
+        _samples[name].append(now - since)
+    return now
+
+
+def drain():
+    """Ritorna {stadio: secondi} accumulati dall'ultima chiamata e azzera i campioni."""
+    timings = {name: sum(values) for name, values in _samples.items()}
+    _samples.clear()
+    return timings
+
+
+def percentile(sorted_values, q):
+    """Percentile con il metodo nearest-rank su una lista già ordinata."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class StageReport:
+    """
+    Raccoglie nel processo principale i tempi per stadio (un campione per file,
+    o per richiesta bulk) e il tempo totale di ogni file.
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.file_times = []
+
+    def add(self, name, seconds):
+        self.samples[name].append(seconds)
+
+    def add_file(self, file, timings):
+        for name, seconds in timings.items():
+            self.samples[name].append(seconds)
+        if "file.totale" in timings:
+            self.file_times.append((timings["file.totale"], file))
+
+    def count(self, name):
+        """Numero di campioni registrati per lo stadio 'name'."""
+        return len(self.samples.get(name, ()))
+
+    def slowest(self, n):
+        """Gli n file più lenti come lista di (secondi, file)."""
+        return sorted(self.file_times, reverse=True)[:n]
+
+    def summary(self):
+        """Per ogni stadio: count, totale e percentili (in millisecondi)."""
+        result = {}
+        for name in sorted(self.samples):
+            values = sorted(self.samples[name])
+            if not values:
+                continue
+            total = sum(values)
+            result[name] = {
+                "count": len(values),
+                "total_s": round(total, 4),
+                "mean_ms": round(total / len(values) * 1000, 3),
+                "p50_ms": round(percentile(values, 50) * 1000, 3),
+                "p95_ms": round(percentile(values, 95) * 1000, 3),
+                "p99_ms": round(percentile(values, 99) * 1000, 3),
+                "max_ms": round(values[-1] * 1000, 3),
+            }
+        return result
+
+    def print_summary(self):
+        print(f"{'stadio':<28}{'count':>7}{'tot (s)':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name, s in self.summary().items():
+            print(f"{name:<28}{s['count']:>7}{s['total_s']:>10.2f}{s['p50_ms']:>10.2f}"
+                  f"{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}")
+
+    def write_json(self, out_path, **extra):
+        """Scrive il report JSON (stadi, file più lenti e campi extra)."""
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        report = dict(extra)
+        report["stages"] = self.summary()
+        report["slowest_files"] = [{"file": f, "seconds": round(s, 4)} for s, f in self.slowest(20)]
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return out_path
+
+
+def profile_call(out_path, func, *args, **kwargs):
+    """Esegue func sotto cProfile e salva le statistiche in out_path (.prof)."""
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        profiler.dump_stats(out_path)
+
+
+class TimedIterator:
+    """
+    Avvolge un iteratore e misura il tempo speso a produrre gli elementi
+    ('busy') e il numero di richieste ricevute ('calls'). Serve a separare,
+    in streaming_bulk, il tempo di parsing da quello delle richieste a ES.
+    """
+
+    def __init__(self, iterable):
+        self._it = iter(iterable)
+        self.busy = 0.0
+        self.calls = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.calls += 1
+        start = time.perf_counter()
+        try:
+            return next(self._it)
+        finally:
+            self.busy += time.perf_counter() - start
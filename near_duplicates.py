@@ -0,0 +1,127 @@
+# near_duplicates.py
+# Rilevamento dei quasi-duplicati (documenti e tabelle) durante l'ingestione.
+# Il corpus arXiv contiene più versioni dello stesso paper (es. 2301.06264v1/v2)
+# e PMC restituisce articoli sovrapposti: senza questo controllo gli stessi
+# paragrafi e tabelle finiscono nell'indice più volte.
+#
+# - firma MinHash (one-permutation hashing con densificazione): un solo hash
+#   per shingle invece di NUM_PERM, quindi economica da calcolare nei worker
+# - indice LSH a bande: la ricerca dei candidati costa un lookup per banda
+#   e non cresce con la dimensione del corpus
+import bisect
+import hashlib
+import re
+import struct
+from collections import defaultdict
+
+NUM_PERM = 128               # valori della firma (4 byte ciascuno)
+BANDS = 16                   # bande LSH da NUM_PERM / BANDS righe: soglia "morbida" ~0.7
+SHINGLE_SIZE = 5             # shingle = 5 parole consecutive
+MIN_SHINGLES = 8             # testi più corti non hanno una firma affidabile
+SIMILARITY_THRESHOLD = 0.8   # Jaccard stimata oltre la quale due testi sono quasi-duplicati
+
+WORD_RE = re.compile(r"\w+")
+_MASK32 = 0xFFFFFFFF
+_GOLDEN32 = 0x9E3779B1       # costante per distinguere i bin riempiti dalla densificazione
+
+
+def shingles(text, k=SHINGLE_SIZE):
+    """Insieme dei k-gram di parole (minuscole) del testo."""
+    words = WORD_RE.findall(text.lower())
+    if len(words) <= k:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+
+def _hash64(shingle):
+    # hash stabile tra processi e run (hash() di Python è randomizzato)
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def signature(text, num_perm=NUM_PERM, min_shingles=MIN_SHINGLES):
+    """
+    Firma MinHash del testo come bytes (num_perm valori a 32 bit), o None se
+    il testo ha meno di min_shingles shingle. Ogni shingle viene hashato una
+    volta: i bit bassi scelgono il bin, quelli alti sono il valore; ogni bin
+    tiene il minimo. I bin vuoti copiano il primo bin pieno successivo.
+    """
+    items = shingles(text)
+    if len(items) < min_shingles:
+        return None
+    mins = [None] * num_perm
+    for item in items:
+        h = _hash64(item)
+        b, v = h % num_perm, (h >> 32) & _MASK32
+        if mins[b] is None or v < mins[b]:
+            mins[b] = v
+
+    filled = [i for i, v in enumerate(mins) if v is not None]
+    if len(filled) < num_perm:
+        for i in range(num_perm):
+            if mins[i] is None:
+                j = filled[bisect.bisect(filled, i) % len(filled)]
+                mins[i] = mins[j] ^ ((i * _GOLDEN32) & _MASK32)
+    return struct.pack(f"<{num_perm}I", *mins)
+
+
+def similarity(sig_a, sig_b):
+    """Jaccard stimata: frazione di valori uguali nelle due firme."""
+    n = len(sig_a) // 4
+    a = struct.unpack(f"<{n}I", sig_a)
+    b = struct.unpack(f"<{n}I", sig_b)
+    return sum(x == y for x, y in zip(a, b)) / n
+
+
+def to_hex(sig):
+    """Firma -> stringa, per salvarla nel manifest (JSON)."""
+    return sig.hex() if sig is not None else None
+
+
+def from_hex(value):
+    return bytes.fromhex(value) if value else None
+
+
+class LSHIndex:
+    """
+    Indice LSH a bande sulle firme MinHash: due firme finiscono nello stesso
+    bucket se coincidono su tutte le righe di almeno una banda. Le coppie
+    candidate vengono poi verificate con la similarità stimata.
+    """
+
+    def __init__(self, bands=BANDS, num_perm=NUM_PERM):
+        if num_perm % bands:
+            raise ValueError("num_perm deve essere multiplo di bands")
+        self.bands = bands
+        self.width = num_perm * 4 // bands   # byte per banda
+        self.buckets = defaultdict(list)
+        self.signatures = {}
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def _band_keys(self, sig):
+        return [hash((i, sig[i * self.width:(i + 1) * self.width])) for i in range(self.bands)]
+
+    def add(self, key, sig):
+        if sig is None or key in self.signatures:
+            return
+        self.signatures[key] = sig
+        for band_key in self._band_keys(sig):
+            self.buckets[band_key].append(key)
+
+    def query(self, sig, threshold=SIMILARITY_THRESHOLD):
+        """
+        Elemento già indicizzato più simile a 'sig' come (chiave, similarità),
+        o None se nessuno supera la soglia.
+        """
+        if sig is None:
+            return None
+        candidates = set()
+        for band_key in self._band_keys(sig):
+            candidates.update(self.buckets.get(band_key, ()))
+        best = None
+        for key in candidates:
+            sim = similarity(sig, self.signatures[key])
+            if sim >= threshold and (best is None or sim > best[1]):
+                best = (key, sim)
+        return best
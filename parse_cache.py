@@ -0,0 +1,112 @@
+# parse_cache.py
+# Cache su disco dell'output di parse_html + extract_tables.
+# Chiave: hash del contenuto HTML + backend di parsing; le voci sono separate
+# per "versione del codice di parsing", così una modifica alle euristiche
+# invalida automaticamente tutto quello che è stato calcolato prima.
+import gzip
+import hashlib
+import inspect
+import json
+import os
+import shutil
+
+# Da incrementare a mano per forzare l'invalidazione (es. cambia una dipendenza)
+PARSER_VERSION = 1
+
+
+def code_version(*objects):
+    """
+    Versione del codice di parsing: hash di PARSER_VERSION e del sorgente
+    degli oggetti passati (funzioni o moduli). Cambia il codice -> cambia la versione.
+    """
+    h = hashlib.sha1(str(PARSER_VERSION).encode())
+    for obj in objects:
+        h.update(inspect.getsource(obj).encode("utf-8"))
+    return h.hexdigest()[:12]
+
+
+def cache_key(raw: bytes, parser: str) -> str:
+    """Chiave di una voce: SHA-1 del contenuto del file + backend di parsing."""
+    return f"{hashlib.sha1(raw).hexdigest()}-{parser.replace('.', '_')}"
+
+
+def _entry_path(cache_dir, version, key):
+    # Due caratteri di fan-out: evita cartelle con decine di migliaia di file
+    return os.path.join(cache_dir, version, key[:2], key + ".json.gz")
+
+
+def get(cache_dir, version, key):
+    """Ritorna il valore salvato o None (voce assente o illeggibile)."""
+    path = _entry_path(cache_dir, version, key)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            value = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, EOFError):
+        # Voce corrotta (es. run interrotta): la si ricalcola
+        return None
+    try:
+        os.utime(path)  # mtime = ultimo utilizzo, per l'eviction LRU
+    except OSError:
+        pass
+    return value
+
+
+def put(cache_dir, version, key, value):
+    """Salva una voce in modo atomico (i worker possono scrivere in parallelo)."""
+    path = _entry_path(cache_dir, version, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=5) as f:
+        json.dump(value, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def invalidate_stale(cache_dir, version):
+    """Elimina le voci prodotte da versioni precedenti del codice di parsing."""
+    if not os.path.isdir(cache_dir):
+        return 0
+    removed = 0
+    for name in os.listdir(cache_dir):
+        if name != version and os.path.isdir(os.path.join(cache_dir, name)):
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def clear(cache_dir):
+    """Svuota completamente la cache."""
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def enforce_size(cache_dir, max_bytes):
+    """
+    Mantiene la cache sotto max_bytes eliminando le voci usate meno di
+    recente (mtime più vecchio). Ritorna (voci eliminate, byte rimasti).
+    """
+    entries = []
+    total = 0
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+    removed = 0
+    if total > max_bytes:
+        entries.sort()
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+    return removed, total
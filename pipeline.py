@@ -0,0 +1,279 @@
+# pipeline.py
+# Modalità in pipeline: download, parsing e indicizzazione girano insieme,
+# così un articolo scaricato al primo minuto di un crawl di 40 minuti è
+# cercabile dopo pochi secondi invece che alla fine di index_directory.
+#
+#   download (asyncio, main thread)
+#     -> coda file (limitata) -> parsing (ProcessPoolExecutor)
+#     -> coda risultati -> azioni bulk (dedup, tabelle) -> coda azioni (limitata)
+#     -> bulk verso Elasticsearch ogni FLUSH_DOCS azioni o FLUSH_INTERVAL secondi
+#
+# Ogni coda è limitata: se uno stadio rallenta, quelli a monte si fermano
+# (fino al downloader, che smette di prendere nuovi job).
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from elasticsearch import helpers
+
+import download_html
+import index_documents as idx
+import instrumentation
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+DATASET = download_html.DATASET     # "arxiv" o "pubmed"
+
+FILE_QUEUE_SIZE = 64                # file scaricati in attesa di parsing
+PARSE_IN_FLIGHT = 32                # file in parsing o parsati e non ancora consumati
+ACTION_QUEUE_SIZE = 2000            # azioni bulk in attesa di essere inviate
+PARSE_WORKERS = idx.PARSE_WORKERS
+
+FLUSH_DOCS = idx.BULK_CHUNK_DOCS    # bulk appena ci sono tante azioni...
+FLUSH_INTERVAL = 5.0                # ...o al più tardi dopo tanti secondi dalla prima in attesa
+MANIFEST_SAVE_INTERVAL = 60.0       # secondi tra un salvataggio del manifest e il successivo
+PROGRESS_INTERVAL = 10.0            # secondi tra una riga di avanzamento e la successiva
+
+_DONE = object()                    # fine dello stream in una coda
+
+
+def iter_queue(q):
+    """Elementi della coda fino al marcatore di fine."""
+    while True:
+        item = q.get()
+        if item is _DONE:
+            return
+        yield item
+
+
+def drain(q):
+    """Consuma (e scarta) la coda fino al marcatore: gli stadi a monte non restano bloccati."""
+    for _ in iter_queue(q):
+        pass
+
+
+# ============================================================
+# AVANZAMENTO
+# ============================================================
+
+class Progress:
+    """Contatori condivisi tra gli stadi e riga di avanzamento periodica."""
+
+    def __init__(self, stats, report, queues):
+        self.stats = stats
+        self.report = report
+        self.queues = queues        # nome -> coda, per la profondità
+        self.downloaded = 0
+        self.downloaded_bytes = 0
+        self.flushes = 0
+        self.start = time.perf_counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="progress", daemon=True)
+
+    def add_download(self, path):
+        self.downloaded += 1
+        self.downloaded_bytes += os.path.getsize(path)
+
+    def line(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        parsed = self.report.count("file.totale")
+        depths = ", ".join(f"{name} {q.qsize()}/{q.maxsize or '∞'}" for name, q in self.queues.items())
+        return (f"[PIPELINE] {elapsed:6.0f}s | scaricati {self.downloaded} "
+                f"({self.downloaded_bytes / (1024 * 1024) / elapsed:.2f} MB/s) | parsati {parsed} | "
+                f"indicizzati {self.stats['indicizzati']} doc ({self.stats['indicizzati'] / elapsed:.2f} doc/s), "
+                f"{self.stats['tabelle']} tabelle | bulk {self.flushes} | code: {depths}")
+
+    def _loop(self):
+        while not self._stop.wait(PROGRESS_INTERVAL):
+            print(self.line())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        print(self.line())
+
+
+# ============================================================
+# STADI
+# ============================================================
+
+def parse_stage(files_q, parsed_q, slots, source, new_entries, workers, parser):
+    """
+    Manda in parsing ogni file scaricato appena arriva. 'slots' limita i file
+    in parsing o in attesa in parsed_q (il consumatore libera lo slot).
+    """
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+            for path in iter_queue(files_q):
+                new_entries[path] = idx.manifest_entry(path)
+                slots.acquire()
+                future = pool.submit(idx._parse_task, path, source, parser)
+                future.add_done_callback(lambda f, path=path: parsed_q.put(_task_result(f, path)))
+    except Exception as e:
+        print(f"[ERRORE] Stadio di parsing interrotto: {type(e).__name__}: {e}")
+        drain(files_q)
+    finally:
+        # il with attende i future ancora in corso: dopo non arrivano altri risultati
+        parsed_q.put(_DONE)
+
+
+def _task_result(future, path):
+    try:
+        return future.result()
+    except Exception as e:  # es. worker terminato in modo anomalo
+        return path, None, [], f"{type(e).__name__}: {e}", {}
+
+
+def action_stage(parsed_q, actions_q, slots, source, stats, pending, manifest, new_entries, report, dedup):
+    """Trasforma i documenti parsati in azioni bulk (come index_directory)."""
+    def parsed():
+        for result in iter_queue(parsed_q):
+            slots.release()
+            yield result
+
+    try:
+        for action in idx._generate_actions((), source, stats, pending, old_entries=manifest["files"],
+                                            new_entries=new_entries, report=report, dedup=dedup,
+                                            parsed=parsed()):
+            actions_q.put(action)
+    except Exception as e:
+        print(f"[ERRORE] Stadio delle azioni bulk interrotto: {type(e).__name__}: {e}")
+        for _ in iter_queue(parsed_q):
+            slots.release()
+    finally:
+        actions_q.put(_DONE)
+
+
+def index_stage(actions_q, stats, pending, manifest, new_entries, report, progress):
+    try:
+        _index_loop(actions_q, stats, pending, manifest, new_entries, report, progress)
+    except Exception as e:
+        print(f"[ERRORE] Stadio di indicizzazione interrotto: {type(e).__name__}: {e}")
+        drain(actions_q)
+
+
+def _index_loop(actions_q, stats, pending, manifest, new_entries, report, progress):
+    """
+    Raccoglie le azioni e le invia con streaming_bulk quando sono FLUSH_DOCS
+    o quando la più vecchia aspetta da FLUSH_INTERVAL secondi.
+    """
+    batch, first = [], None
+    last_save = time.monotonic()
+    finished = False
+    while not finished:
+        timeout = None if first is None else max(0.0, FLUSH_INTERVAL - (time.monotonic() - first))
+        try:
+            action = actions_q.get(timeout=timeout)
+        except queue.Empty:
+            action = None                       # tempo scaduto: si invia quello che c'è
+        if action is _DONE:
+            finished = True
+        elif action is not None:
+            batch.append(action)
+            first = first or time.monotonic()
+            if len(batch) < FLUSH_DOCS:
+                continue
+        if not batch:
+            continue
+
+        start = time.perf_counter()
+        try:
+            for ok, item in helpers.streaming_bulk(idx.ES, batch, chunk_size=FLUSH_DOCS,
+                                                   max_chunk_bytes=idx.BULK_CHUNK_BYTES,
+                                                   max_retries=idx.BULK_MAX_RETRIES,
+                                                   raise_on_error=False, raise_on_exception=False):
+                idx._handle_bulk_result(ok, item, pending, stats, manifest, new_entries)
+        except Exception as e:
+            stats["falliti"] += len(batch)
+            print(f"[ERRORE] Bulk di {len(batch)} azioni fallito: {type(e).__name__}: {e}")
+        report.add("es.bulk", time.perf_counter() - start)
+        progress.flushes += 1
+        batch, first = [], None
+
+        if time.monotonic() - last_save >= MANIFEST_SAVE_INTERVAL:
+            idx.save_manifest(manifest)
+            last_save = time.monotonic()
+
+
+# ============================================================
+# PIPELINE
+# ============================================================
+
+def run_pipeline(dataset=DATASET, workers=PARSE_WORKERS, parser=idx.PARSER_BACKEND):
+    """Scarica gli articoli del dataset e li indicizza man mano che arrivano."""
+    if dataset == "arxiv":
+        folder, source, run_download = download_html.ARXIV_DIR, "arxiv", download_html.run_arxiv
+    elif dataset == "pubmed":
+        folder, source, run_download = download_html.PMC_DIR, "pubmed", download_html.run_pmc
+    else:
+        raise ValueError("DATASET must be 'arxiv' or 'pubmed'")
+
+    if not idx.indices_exist():
+        idx.create_index()
+    manifest = idx.load_manifest()
+    dedup = idx.build_duplicate_indexes(manifest) if idx.NEAR_DUP_POLICY else None
+
+    files_q = queue.Queue(maxsize=FILE_QUEUE_SIZE)
+    parsed_q = queue.Queue()                 # limitata da 'slots'
+    actions_q = queue.Queue(maxsize=ACTION_QUEUE_SIZE)
+    slots = threading.BoundedSemaphore(PARSE_IN_FLIGHT)
+
+    stats = idx.new_stats()
+    pending = {}
+    new_entries = {}
+    report = instrumentation.StageReport()
+    progress = Progress(stats, report, {"file": files_q, "azioni": actions_q})
+
+    def enqueue(paths):
+        # gira in un thread: se la coda è piena il downloader aspetta (backpressure)
+        for path in paths:
+            progress.add_download(path)
+            files_q.put(path)
+
+    def on_file(paths):
+        return asyncio.to_thread(enqueue, paths)
+
+    stages = [
+        threading.Thread(target=parse_stage, name="parse",
+                         args=(files_q, parsed_q, slots, source, new_entries, workers, parser)),
+        threading.Thread(target=action_stage, name="actions",
+                         args=(parsed_q, actions_q, slots, source, stats, pending, manifest,
+                               new_entries, report, dedup)),
+        threading.Thread(target=index_stage, name="index",
+                         args=(actions_q, stats, pending, manifest, new_entries, report, progress)),
+    ]
+    print(f"\nPipeline {dataset}: download -> parsing ({workers} worker, {parser}) -> Elasticsearch "
+          f"(bulk ogni {FLUSH_DOCS} azioni o {FLUSH_INTERVAL:.0f}s)\n")
+    with progress:
+        for thread in stages:
+            thread.start()
+        try:
+            run_download(on_file=on_file)
+        finally:
+            # fine del crawl (o interruzione): gli stadi finiscono il lavoro già in coda
+            files_q.put(_DONE)
+            for thread in stages:
+                thread.join()
+            idx.save_manifest(manifest)
+
+    elapsed = time.perf_counter() - progress.start
+    idx._print_summary(str(folder), stats, elapsed)
+    idx._write_report(str(folder), source, stats, report, elapsed, workers, parser)
+    return stats
+
+
+def main():
+    run_pipeline()
+
+
+if __name__ == "__main__":
+    main()
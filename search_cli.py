@@ -1,10 +1,29 @@
 # search_cli.py
+import re
 from elasticsearch import Elasticsearch
 
 ES = Elasticsearch("http://localhost:9200")
 INDEX_NAME = "research_articles_v2"
+TABLES_INDEX_NAME = "research_tables"
 
 DEFAULT_FIELDS = ["title", "abstract", "paragraphs"]
+TABLE_FIELDS = ["caption", "body", "mentions", "context_paragraphs"]
+DEFAULT_TABLE_FIELDS = ["caption", "body", "mentions"]
+
+# Filtro sulle colonne numeriche delle tabelle: "<colonna> <op> <valore>", es. "HR > 1.5"
+NUMERIC_FILTER_RE = re.compile(r"^\s*(.+?)\s*(>=|<=|>|<|=)\s*(-?\d+(?:\.\d+)?)\s*$")
+RANGE_OPS = {">": "gt", ">=": "gte", "<": "lt", "<=": "lte"}
+
+# I quasi-duplicati (campo duplicate_of, vedi NEAR_DUP_POLICY in index_documents)
+# vengono esclusi dai risultati: resta solo l'originale
+HIDE_DUPLICATES = True
+
+
+def without_duplicates(query):
+    """Aggiunge alla query l'esclusione dei quasi-duplicati (se HIDE_DUPLICATES)."""
+    if not HIDE_DUPLICATES:
+        return query
+    return {"bool": {"must": [query], "must_not": [{"exists": {"field": "duplicate_of"}}]}}
 
 def run_search(query, fields=None, size=10):
     """
@@ -15,12 +34,12 @@ def run_search(query, fields=None, size=10):
         fields = DEFAULT_FIELDS
 
     body = {
-        "query": {
+        "query": without_duplicates({
             "query_string": {
                 "query": query,
                 "fields": fields
             }
-        },
+        }),
         "size": size
     }
 
@@ -28,13 +47,93 @@ def run_search(query, fields=None, size=10):
     return resp["hits"]["hits"]
 
 
+def numeric_filter_query(expr):
+    """
+    Traduce "HR > 1.5" in una query nested sulle colonne delle tabelle:
+    almeno una cella della colonna il cui nome contiene "HR" vale più di 1.5.
+    Ritorna None se l'espressione non è valida.
+    """
+    m = NUMERIC_FILTER_RE.match(expr)
+    if not m:
+        return None
+    column, op, value = m.group(1), m.group(2), float(m.group(3))
+    if op == "=":
+        condition = {"term": {"columns.numbers": value}}
+    else:
+        condition = {"range": {"columns.numbers": {RANGE_OPS[op]: value}}}
+    return {
+        "nested": {
+            "path": "columns",
+            "query": {
+                "bool": {
+                    "must": [
+                        {"match": {"columns.name": {"query": column, "operator": "and"}}},
+                        condition
+                    ]
+                }
+            }
+        }
+    }
+
+
+def run_table_search(query, fields=None, size=10, numeric_filter=None):
+    """
+    Come run_search, ma sull'indice delle tabelle: ogni hit è una singola
+    tabella (caption, body, mentions, context_paragraphs) e non un articolo.
+    'numeric_filter' (es. "HR > 1.5") filtra sulle colonne numeriche;
+    con query vuota restituisce tutte le tabelle che soddisfano il filtro.
+    """
+    if not fields:
+        fields = DEFAULT_TABLE_FIELDS
+
+    if query:
+        text_query = {"query_string": {"query": query, "fields": fields}}
+    else:
+        text_query = {"match_all": {}}
+
+    nested = numeric_filter_query(numeric_filter) if numeric_filter else None
+    if nested:
+        text_query = {"bool": {"must": [text_query], "filter": [nested]}}
+
+    body = {
+        "query": without_duplicates(text_query),
+        "size": size
+    }
+
+    resp = ES.search(index=TABLES_INDEX_NAME, body=body)
+    return resp["hits"]["hits"]
+
+
+def print_table_hits(hits):
+    print(f"\nTabelle trovate: {len(hits)}")
+    print("-" * 60)
+    for h in hits:
+        src = h["_source"]
+        print(f"Score:   {h['_score']:.2f}")
+        print(f"Paper:   {src.get('paper_id')} ({src.get('source')})")
+        print(f"Tabella: {src.get('table_id')}")
+        print(f"Caption: {src.get('caption')}")
+        print(f"Body:    {src.get('body', '')[:300]}...")
+        numeric = [c["name"] for c in src.get("columns") or [] if c.get("numeric") and c.get("name")]
+        if numeric:
+            print(f"Colonne numeriche: {', '.join(numeric)}")
+        mentions = src.get("mentions") or []
+        if mentions:
+            print(f"Citata:  {mentions[0][:200]}...")
+        print("-" * 60)
+    print()
+
+
 def main():
     print("=== SHELL DI RICERCA (Elasticsearch) ===")
     print("Campi disponibili: title, authors, abstract, paragraphs, content_full")
+    print("Tabelle (prefisso 'tab:'): caption, body, mentions, context_paragraphs")
     print("Esempi di query:")
     print('  entity AND resolution')
     print('  "entity matching"')
     print('  (entity OR record) AND resolution')
+    print('  tab: precision AND recall')
+    print('  tab: hazard ratio   (poi filtro numerico: HR > 1.5)')
     print("---------------------------------------\n")
 
     while True:
@@ -43,6 +142,20 @@ def main():
             print("Bye!")
             break
 
+        # Ricerca sulle tabelle: "tab: <query>"
+        if q.lower().startswith("tab:"):
+            q = q[4:].strip()
+            fields_raw = input(
+                "Campi (es: caption,body) [default: caption,body,mentions]: "
+            ).strip()
+            fields = [f.strip() for f in fields_raw.split(",") if f.strip()] or DEFAULT_TABLE_FIELDS
+            numeric_filter = input("Filtro numerico (es: HR > 1.5) [invio per nessuno]: ").strip()
+            if numeric_filter and not numeric_filter_query(numeric_filter):
+                print("Filtro non valido (formato: <colonna> <op> <valore>), lo ignoro.")
+                numeric_filter = None
+            print_table_hits(run_table_search(q, fields=fields, size=10, numeric_filter=numeric_filter))
+            continue
+
         fields_raw = input(
             "Campi (es: title,abstract,paragraphs) [default: title,abstract,paragraphs]: "
         ).strip()
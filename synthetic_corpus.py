@@ -0,0 +1,202 @@
+# synthetic_corpus.py
+# Generatore di pagine HTML sintetiche con il layout di arXiv (HTML di LaTeXML)
+# e di PMC, a dimensione controllabile (paragrafi, tabelle, autori).
+# Serve ai benchmark offline (benchmark.py): nessun download, pagine
+# riproducibili a partire da un seed.
+import os
+import random
+from collections import defaultdict
+
+LAYOUTS = ("arxiv", "pmc")
+
+# Dimensioni di default di una pagina
+DEFAULT_PARAGRAPHS = 50
+DEFAULT_TABLES = 5
+DEFAULT_AUTHORS = 5
+DEFAULT_BOILERPLATE = 200      # link di menu/footer: la parte di pagina che non serve
+
+OUTPUT_DIR = "html_corpus_synthetic"
+
+VOCAB = (
+    "entity resolution matching record linkage blocking precision recall accuracy dataset "
+    "baseline model training evaluation cohort patients risk cardiovascular intake food "
+    "processed hazard ratio confidence interval adjusted analysis sample threshold feature "
+    "embedding similarity attribute schema pipeline benchmark results experiment method"
+).split()
+
+FIRST_NAMES = ["Mario", "Giulia", "Luca", "Anna", "Marco", "Sara", "Paolo", "Elena",
+               "John", "Maria", "Wei", "Aisha", "Carlos", "Yuki", "Olga", "David"]
+LAST_NAMES = ["Rossi", "Bianchi", "Romano", "Colombo", "Ricci", "Marino", "Greco",
+              "Smith", "Garcia", "Chen", "Kumar", "Tanaka", "Novak", "Silva", "Muller"]
+SECTIONS = ["Introduction", "Related Work", "Methods", "Experiments", "Results", "Discussion"]
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def _sentence(rnd, n_words):
+    return " ".join(rnd.choice(VOCAB) for _ in range(n_words)).capitalize() + "."
+
+
+def _paragraph(rnd, n_tables):
+    """Paragrafo di 3-6 frasi; a volte cita una tabella, un intervallo o un elenco."""
+    text = " ".join(_sentence(rnd, rnd.randint(12, 25)) for _ in range(rnd.randint(3, 6)))
+    if n_tables and rnd.random() < 0.3:
+        a = rnd.randint(1, n_tables)
+        b = min(n_tables, a + rnd.randint(1, 3))
+        text += rnd.choice([f" As shown in Table {a}, the effect is consistent.",
+                            f" See Tab. {a} for details.",
+                            f" Tables {a}–{b} summarize the results."])
+    return text
+
+
+def _authors(rnd, n_authors):
+    return [f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}" for _ in range(n_authors)]
+
+
+def _table_rows(rnd, n_rows, n_cols):
+    rows = []
+    for _ in range(n_rows):
+        cells = [f"<td>{rnd.choice(VOCAB)} {rnd.choice(VOCAB)}</td>"]
+        for _ in range(n_cols - 1):
+            value = rnd.uniform(0.1, 3.0)
+            cells.append(f"<td>{value:.2f} ({value * 0.8:.2f}–{value * 1.2:.2f})</td>")
+        rows.append("<tr>" + "".join(cells) + "</tr>")
+    return "".join(rows)
+
+
+def _arxiv_table(rnd, section, num):
+    n_cols = rnd.randint(3, 6)
+    header = "".join(f'<th class="ltx_th">{rnd.choice(VOCAB).upper()}</th>' for _ in range(n_cols))
+    return (
+        f'<figure class="ltx_table" id="S{section}.T{num}">'
+        f'<figcaption class="ltx_caption"><span class="ltx_tag">Table {num}: </span>'
+        f'{_sentence(rnd, 10)}</figcaption>'
+        f'<table class="ltx_tabular" id="T{num}"><thead><tr>{header}</tr></thead>'
+        f'<tbody>{_table_rows(rnd, rnd.randint(4, 15), n_cols)}</tbody></table></figure>'
+    )
+
+
+def _pmc_table(rnd, pmc_id, num):
+    # intestazione su due righe (rowspan/colspan), come nelle tabelle di PMC
+    n_cols = rnd.randint(3, 6)
+    subheader = "".join(f"<th>HR {c}</th>" for c in range(1, n_cols))
+    return (
+        f'<div class="table-wrap" id="{pmc_id}-T{num}">'
+        f'<div class="caption"><p>Table {num}. {_sentence(rnd, 10)}</p></div>'
+        f'<table><thead><tr><th rowspan="2">Variable</th><th colspan="{n_cols - 1}">Model {num}</th></tr>'
+        f'<tr>{subheader}</tr></thead>'
+        f'<tbody>{_table_rows(rnd, rnd.randint(4, 15), n_cols)}</tbody></table></div>'
+    )
+
+
+def _boilerplate(n_links):
+    links = "".join(f'<li><a href="/page/{i}">Menu item {i}</a></li>' for i in range(n_links))
+    return f'<nav class="navbar"><ul>{links}</ul></nav>'
+
+
+def arxiv_page(rnd, n_paragraphs, n_tables, n_authors, n_boilerplate, arxiv_id):
+    """Pagina nel formato dell'HTML di arXiv (LaTeXML / ar5iv)."""
+    title = _sentence(rnd, 8).rstrip(".")
+    day, month, year = rnd.randint(1, 28), rnd.choice(MONTHS), rnd.randint(2015, 2024)
+    authors = "".join(
+        f'<span class="ltx_creator ltx_role_author"><span class="ltx_personname">{name}</span></span>'
+        for name in _authors(rnd, n_authors)
+    )
+    parts = [
+        f"<html><head><title>{title}</title></head><body>",
+        _boilerplate(n_boilerplate),
+        f'<div id="content"><div class="ltx_page_header">arXiv:{arxiv_id} [cs.DB] {day} {month} {year}</div>',
+        f'<h1 class="ltx_title ltx_title_document">{title}</h1>',
+        f'<div class="ltx_authors">{authors}</div>',
+        f'<div class="ltx_abstract"><h6 class="ltx_title">Abstract</h6><p class="ltx_p">{_paragraph(rnd, 0)}</p></div>',
+    ]
+    per_section = max(1, n_paragraphs // len(SECTIONS))
+    table_num = 0
+    for s, name in enumerate(SECTIONS, start=1):
+        parts.append(f'<section class="ltx_section" id="S{s}"><h2 class="ltx_title">{s} {name}</h2>')
+        count = per_section if s < len(SECTIONS) else max(0, n_paragraphs - per_section * (len(SECTIONS) - 1))
+        for _ in range(count):
+            parts.append(f'<div class="ltx_para"><p class="ltx_p">{_paragraph(rnd, n_tables)}</p></div>')
+        # tabelle distribuite tra le sezioni
+        while table_num < n_tables * s // len(SECTIONS):
+            table_num += 1
+            parts.append(_arxiv_table(rnd, s, table_num))
+        parts.append("</section>")
+    refs = "".join(f'<li class="ltx_bibitem">{_sentence(rnd, 12)}</li>' for _ in range(30))
+    parts.append(f'<section class="ltx_bibliography"><h2>References</h2><ul>{refs}</ul></section>')
+    parts.append("</div></body></html>")
+    return "".join(parts)
+
+
+def pmc_page(rnd, n_paragraphs, n_tables, n_authors, n_boilerplate, pmc_id):
+    """Pagina nel formato di PubMed Central (metadati citation_* e div.table-wrap)."""
+    title = _sentence(rnd, 10).rstrip(".")
+    meta = [f'<meta name="citation_title" content="{title}">']
+    meta += [f'<meta name="citation_author" content="{name}">' for name in _authors(rnd, n_authors)]
+    meta.append(f'<meta name="citation_publication_date" content="{rnd.randint(2010, 2024)}">')
+    parts = [
+        "<html><head>", "".join(meta), f"<title>{title} - PMC</title></head><body>",
+        _boilerplate(n_boilerplate),
+        f'<article><h1 class="content-title">{title}</h1>',
+        f'<div class="abstract"><h2>Abstract</h2><p>{_paragraph(rnd, 0)}</p></div>',
+    ]
+    # paragrafo dopo cui inserire ogni tabella (distribuite uniformemente)
+    table_slots = defaultdict(list)
+    for t in range(1, n_tables + 1):
+        table_slots[max(0, t * n_paragraphs // n_tables - 1)].append(t)
+    per_section = max(1, n_paragraphs // len(SECTIONS))
+    for i in range(max(n_paragraphs, 1)):
+        if i % per_section == 0 and i // per_section < len(SECTIONS):
+            parts.append(f'<h2 class="head">{SECTIONS[i // per_section]}</h2>')
+        if i < n_paragraphs:
+            parts.append(f"<p>{_paragraph(rnd, n_tables)}</p>")
+        for t in table_slots[i]:
+            parts.append(_pmc_table(rnd, pmc_id, t))
+    refs = "".join(f"<li>{_sentence(rnd, 12)}</li>" for _ in range(30))
+    parts.append(f'<div class="ref-list"><h2>References</h2><ul>{refs}</ul></div>')
+    parts.append("</article></body></html>")
+    return "".join(parts)
+
+
+def generate_page(layout, seed=0, paragraphs=DEFAULT_PARAGRAPHS, tables=DEFAULT_TABLES,
+                  authors=DEFAULT_AUTHORS, boilerplate=DEFAULT_BOILERPLATE):
+    """
+    Pagina HTML sintetica (stringa) con il layout richiesto ("arxiv" o "pmc").
+    Lo stesso seed produce sempre la stessa pagina.
+    """
+    rnd = random.Random(f"{layout}-{seed}")
+    if layout == "arxiv":
+        return arxiv_page(rnd, paragraphs, tables, authors, boilerplate, f"2301.{seed:05d}v1")
+    if layout == "pmc":
+        return pmc_page(rnd, paragraphs, tables, authors, boilerplate, f"PMC{1000000 + seed}")
+    raise ValueError(f"Layout sconosciuto: {layout!r} (disponibili: {', '.join(LAYOUTS)})")
+
+
+def page_name(layout, seed):
+    """Nome del file come nel corpus reale (es. 2301.00007v1.html, PMC1000007.html)."""
+    return f"2301.{seed:05d}v1.html" if layout == "arxiv" else f"PMC{1000000 + seed}.html"
+
+
+def generate_corpus(out_dir, layout, pages, seed=0, **sizes):
+    """Scrive 'pages' pagine sintetiche in out_dir e ritorna i percorsi dei file."""
+    os.makedirs(out_dir, exist_ok=True)
+    files = []
+    for i in range(seed, seed + pages):
+        path = os.path.join(out_dir, page_name(layout, i))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(generate_page(layout, i, **sizes))
+        files.append(path)
+    return files
+
+
+def main():
+    # ⚙️ Corpus sintetico con la stessa struttura di html_corpus
+    PAGINE = 200
+    for layout, folder in (("arxiv", "arxiv_html"), ("pmc", "pmc_html")):
+        out_dir = os.path.join(OUTPUT_DIR, folder)
+        files = generate_corpus(out_dir, layout, PAGINE)
+        size = sum(os.path.getsize(f) for f in files) / (1024 * 1024)
+        print(f"{layout}: {len(files)} pagine in {out_dir} ({size:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,18 @@
 # web_app.py
 from flask import Flask, request, render_template_string
 from elasticsearch import Elasticsearch
+from search_cli import numeric_filter_query, without_duplicates
 
 ES = Elasticsearch("http://localhost:9200")
 INDEX_NAME = "research_articles_v2"
+TABLES_INDEX_NAME = "research_tables"
 
 ALL_FIELDS = ["title", "authors", "abstract", "paragraphs", "content_full"]
 DEFAULT_FIELDS = ["title", "abstract", "paragraphs"]
 
+ALL_TABLE_FIELDS = ["caption", "body", "mentions", "context_paragraphs"]
+DEFAULT_TABLE_FIELDS = ["caption", "body", "mentions"]
+
 app = Flask(__name__)
 
 HTML_TEMPLATE = """
@@ -19,6 +24,7 @@ HTML_TEMPLATE = """
 </head>
 <body>
     <h1>Scientific Search</h1>
+    <p><a href="/">Articoli</a> | <a href="/tables">Tabelle</a></p>
     <form method="get" action="/">
         <label>Query:</label>
         <input type="text" name="q" value="{{ q or '' }}" size="60">
@@ -57,15 +63,69 @@ HTML_TEMPLATE = """
 </html>
 """
 
+TABLES_TEMPLATE = """
+<!doctype html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Scientific Search - Tabelle</title>
+</head>
+<body>
+    <h1>Scientific Search - Tabelle</h1>
+    <p><a href="/">Articoli</a> | <a href="/tables">Tabelle</a></p>
+    <form method="get" action="/tables">
+        <label>Query:</label>
+        <input type="text" name="q" value="{{ q or '' }}" size="60">
+        <br>
+        <label>Filtro numerico:</label>
+        <input type="text" name="num" value="{{ num or '' }}" size="20" placeholder="HR > 1.5">
+        {% if num_error %}<span style="color: red;">formato: colonna op valore</span>{% endif %}
+
+        <p>Campi:</p>
+        {% for f in all_fields %}
+            <label>
+                <input type="checkbox" name="fields" value="{{ f }}"
+                       {% if f in fields %}checked{% endif %}>
+                {{ f }}
+            </label><br>
+        {% endfor %}
+
+        <p>
+            <button type="submit">Cerca</button>
+        </p>
+    </form>
+
+    {% if results is not none %}
+        <h2>Tabelle: {{ results|length }}</h2>
+        <hr>
+        {% for r in results %}
+            <div style="margin-bottom: 1.5em;">
+                <strong>{{ r.caption or r.table_id }}</strong><br>
+                <span>{{ r.paper_id }} — {{ r.table_id }} — {{ r.source }}</span><br>
+                <p>{{ r.body }}...</p>
+                {% if r.numeric_columns %}
+                    <p>Colonne numeriche: {{ r.numeric_columns|join(", ") }}</p>
+                {% endif %}
+                {% if r.mention %}
+                    <p><em>Citata in: {{ r.mention }}...</em></p>
+                {% endif %}
+            </div>
+            <hr>
+        {% endfor %}
+    {% endif %}
+</body>
+</html>
+"""
+
 
 def es_search(query, fields, size=20):
     body = {
-        "query": {
+        "query": without_duplicates({
             "query_string": {
                 "query": query,
                 "fields": fields
             }
-        },
+        }),
         "size": size
     }
     resp = ES.search(index=INDEX_NAME, body=body)
@@ -83,6 +143,36 @@ def es_search(query, fields, size=20):
     return results
 
 
+def es_table_search(query, fields, size=20, numeric_filter=None):
+    if query:
+        es_query = {"query_string": {"query": query, "fields": fields}}
+    else:
+        es_query = {"match_all": {}}
+    # filtro sulle colonne numeriche (es. "HR > 1.5"), stessa sintassi della CLI
+    if numeric_filter:
+        es_query = {"bool": {"must": [es_query], "filter": [numeric_filter]}}
+    body = {
+        "query": without_duplicates(es_query),
+        "size": size
+    }
+    resp = ES.search(index=TABLES_INDEX_NAME, body=body)
+    results = []
+    for h in resp["hits"]["hits"]:
+        src = h["_source"]
+        mentions = src.get("mentions") or []
+        results.append({
+            "paper_id": src.get("paper_id", ""),
+            "table_id": src.get("table_id", ""),
+            "caption": src.get("caption", ""),
+            "source": src.get("source", ""),
+            "body": (src.get("body") or "")[:300],
+            "numeric_columns": [c["name"] for c in src.get("columns") or []
+                                if c.get("numeric") and c.get("name")],
+            "mention": mentions[0][:300] if mentions else ""
+        })
+    return results
+
+
 @app.route("/", methods=["GET"])
 def home():
     q = request.args.get("q", "").strip()
@@ -103,5 +193,29 @@ def home():
     )
 
 
+@app.route("/tables", methods=["GET"])
+def tables():
+    q = request.args.get("q", "").strip()
+    fields = request.args.getlist("fields")
+    if not fields:
+        fields = DEFAULT_TABLE_FIELDS
+    num = request.args.get("num", "").strip()
+    numeric_filter = numeric_filter_query(num) if num else None
+
+    results = None
+    if q or numeric_filter:
+        results = es_table_search(q, fields, numeric_filter=numeric_filter)
+
+    return render_template_string(
+        TABLES_TEMPLATE,
+        q=q,
+        num=num,
+        num_error=bool(num) and numeric_filter is None,
+        fields=fields,
+        all_fields=ALL_TABLE_FIELDS,
+        results=results
+    )
+
+
 if __name__ == "__main__":
     app.run(debug=True)